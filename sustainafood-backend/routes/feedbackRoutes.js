@@ -3,6 +3,25 @@ const router = express.Router();
 const Feedback = require('../models/Feedback');
 const mongoose = require('mongoose');
 const axios = require('axios');
+const authMiddleware = require('../Middleware/auth');
+const restrictTo = require('../Middleware/restrictTo');
+
+const AI_SERVICE_URL = process.env.AI_SERVICE_URL || 'http://localhost:5000'; // Flask API URL
+
+// Feedback submission waits on the score, so give up quickly and use the rating-based
+// fallback; the Flask service is told the same deadline and sheds the request in time
+const SATISFACTION_TIMEOUT_MS = Number(process.env.SATISFACTION_TIMEOUT_MS) || 2000;
+const satisfactionRequestConfig = {
+  timeout: SATISFACTION_TIMEOUT_MS,
+  headers: { 'X-Request-Deadline-Ms': String(SATISFACTION_TIMEOUT_MS) },
+};
+
+// Each backfill chunk is one call to the Flask batch endpoint
+const SATISFACTION_BATCH_TIMEOUT_MS = Number(process.env.SATISFACTION_BATCH_TIMEOUT_MS) || 30000;
+const satisfactionBatchRequestConfig = {
+  timeout: SATISFACTION_BATCH_TIMEOUT_MS,
+  headers: { 'X-Request-Deadline-Ms': String(SATISFACTION_BATCH_TIMEOUT_MS) },
+};
 
 // POST - Create new feedback
 router.post('/', async (req, res) => {
@@ -23,10 +42,10 @@ router.post('/', async (req, res) => {
     // Compute satisfaction score by calling Flask endpoint
     let satisfactionScore;
     try {
-      const response = await axios.post('http://localhost:5000/compute_satisfaction', {
+      const response = await axios.post(`${AI_SERVICE_URL}/compute_satisfaction`, {
         rating,
         comment,
-      });
+      }, satisfactionRequestConfig);
       satisfactionScore = response.data.satisfactionScore;
     } catch (error) {
       console.error('Error computing satisfaction score:', error.message);
@@ -50,6 +69,52 @@ router.post('/', async (req, res) => {
   }
 });
 
+// POST - Backfill satisfaction scores for feedback that has none (admin only)
+router.post('/backfill-satisfaction', authMiddleware, restrictTo('admin'), async (req, res) => {
+  try {
+    const feedbacks = await Feedback.find({ satisfactionScore: null }).select('rating comment');
+    const batchSize = 500;
+    let updated = 0;
+    let failed = 0;
+
+    for (let i = 0; i < feedbacks.length; i += batchSize) {
+      const chunk = feedbacks.slice(i, i + batchSize);
+      let results;
+      try {
+        // Score the whole chunk with a single call to the Flask batch endpoint
+        const response = await axios.post(`${AI_SERVICE_URL}/compute_satisfaction/batch`, {
+          items: chunk.map((feedback) => ({ rating: feedback.rating, comment: feedback.comment })),
+        }, satisfactionBatchRequestConfig);
+        results = response.data.results;
+      } catch (error) {
+        // Leave the chunk unscored (e.g. the service shed the request) so a later run retries it
+        console.error('Error computing satisfaction scores:', error.message);
+        failed += chunk.length;
+        continue;
+      }
+
+      const operations = results
+        .filter((result) => result.satisfactionScore !== undefined)
+        .map((result) => ({
+          updateOne: {
+            filter: { _id: chunk[result.index]._id },
+            update: { satisfactionScore: result.satisfactionScore },
+          },
+        }));
+      failed += results.length - operations.length;
+      if (operations.length > 0) {
+        await Feedback.bulkWrite(operations);
+        updated += operations.length;
+      }
+    }
+
+    res.json({ updated, failed });
+  } catch (error) {
+    console.error('Error backfilling satisfaction scores:', error);
+    res.status(500).json({ message: 'Server error' });
+  }
+});
+
 // GET - Get all feedback for a user
 router.get('/:userId', async (req, res) => {
   try {
@@ -82,10 +147,10 @@ router.put('/:id', async (req, res) => {
     // Recompute satisfaction score if rating or comment is updated
     if (req.body.rating || req.body.comment) {
       try {
-        const response = await axios.post('http://localhost:5000/compute_satisfaction', {
+        const response = await axios.post(`${AI_SERVICE_URL}/compute_satisfaction`, {
           rating: feedback.rating,
           comment: feedback.comment,
-        });
+        }, satisfactionRequestConfig);
         feedback.satisfactionScore = response.data.satisfactionScore;
       } catch (error) {
         console.error('Error computing satisfaction score:', error.message);
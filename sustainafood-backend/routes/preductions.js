@@ -2,7 +2,7 @@ const express = require('express');
 const axios = require('axios');
 const router = express.Router();
 
-const FORECAST_API_URL = 'http://localhost:5000'; // Flask API URL
+const FORECAST_API_URL = process.env.AI_SERVICE_URL || 'http://localhost:5000'; // Flask API URL
 
 router.get('/api/forecast/donations', async (req, res) => {
   try {
@@ -26,4 +26,18 @@ router.get('/api/forecast/requests', async (req, res) => {
   }
 });
 
+// Donations, requests and their gap in one call; freq=day|week|month resamples server-side
+router.get('/api/forecast/gap', async (req, res) => {
+  try {
+    const days = req.query.days || 30;
+    const freq = req.query.freq || 'day';
+    const response = await axios.get(`${FORECAST_API_URL}/forecast/gap`, { params: { days, freq } });
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching forecast gap:', error.message);
+    const status = error.response ? error.response.status : 500;
+    res.status(status).json(error.response ? error.response.data : { error: 'Failed to fetch forecast gap' });
+  }
+});
+
 module.exports = router;
\ No newline at end of file
@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+import contextvars
+import logging
+
+from flask import g, jsonify, request
+
+from metrics import QUEUE_DEPTH, SHED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Endpoints share a limit with the others of their group, so a burst on one heavy route
+# cannot take every request thread. Routes not listed here (health, metrics, admin) are
+# never limited. Concurrency is how many requests run at once, queue how many more may
+# wait for a slot, and deadline_ms how long a request may take in total, waiting included.
+ENDPOINT_GROUPS = {
+    'analyze_image': 'image',
+    'analyze_food': 'image',
+    'forecast_donations': 'forecast',
+    'forecast_requests': 'forecast',
+    'forecast_supply_gap': 'forecast',
+    'compute_satisfaction_batch': 'batch',
+    'predict_duration_batch': 'batch',
+    'forecast_food_demand_batch': 'batch',
+    'predict_food_waste_batch': 'batch',
+    'predict_food_event_batch': 'batch',
+    'compute_satisfaction': 'interactive',
+    'predict_duration': 'interactive',
+    'forecast_food_demand': 'interactive',
+    'predict_food_waste': 'interactive',
+}
+
+DEFAULT_LIMITS = {
+    'image': {'concurrency': 2, 'queue': 4, 'deadline_ms': 5000},
+    'forecast': {'concurrency': 2, 'queue': 4, 'deadline_ms': 10000},
+    'batch': {'concurrency': 2, 'queue': 4, 'deadline_ms': 15000},
+    # Feedback submission waits on /compute_satisfaction, so these get the most slots and
+    # a short deadline: a quick 503 lets the backend fall back instead of hanging
+    'interactive': {'concurrency': 8, 'queue': 32, 'deadline_ms': 2000},
+}
+
+# Clients can ask for a shorter deadline than the configured one, e.g. their own timeout
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Monotonic deadline of the request being handled in this context, or None
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# Seconds left before the current request's deadline (None without a deadline)
+def remaining_time():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(what='the request'):
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f'Deadline exceeded before {what}')
+
+
+# Limits for a group or endpoint name, overridable with ADMISSION_<NAME>_CONCURRENCY,
+# ADMISSION_<NAME>_QUEUE and ADMISSION_<NAME>_DEADLINE_MS. A concurrency of 0 disables
+# the limit (the deadline still applies).
+def admission_config(name, concurrency=0, queue=0, deadline_ms=0):
+    prefix = f'ADMISSION_{name.upper()}'
+    return {
+        'concurrency': int(os.environ.get(f'{prefix}_CONCURRENCY', concurrency)),
+        'queue': int(os.environ.get(f'{prefix}_QUEUE', queue)),
+        'deadline_ms': float(os.environ.get(f'{prefix}_DEADLINE_MS', deadline_ms)),
+    }
+
+
+def _configured(name):
+    prefix = f'ADMISSION_{name.upper()}_'
+    return any(variable.startswith(prefix) for variable in os.environ)
+
+
+# Counting semaphore with a bounded wait queue. Waiting requests are admitted as slots
+# free up; a request that finds the queue full, or whose deadline passes while it
+# waits, is shed instead.
+class ConcurrencyLimiter:
+    def __init__(self, name, concurrency, queue, deadline_ms):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.deadline_ms = deadline_ms
+        self.active = 0
+        self.waiting = 0
+        self.shed = {'queue_full': 0, 'deadline': 0}
+        self._condition = threading.Condition()
+
+    # Returns None once admitted, otherwise why the request was shed
+    def acquire(self, deadline):
+        if self.concurrency <= 0:
+            return None
+        with self._condition:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                return None
+            if self.waiting >= self.queue:
+                return self._shed('queue_full')
+            self.waiting += 1
+            QUEUE_DEPTH.labels(self.name).inc()
+            try:
+                while self.active >= self.concurrency:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        # Pass on a wake-up this request may have consumed
+                        self._condition.notify()
+                        return self._shed('deadline')
+                    self._condition.wait(remaining)
+                self.active += 1
+                return None
+            finally:
+                self.waiting -= 1
+                QUEUE_DEPTH.labels(self.name).dec()
+
+    def release(self):
+        if self.concurrency <= 0:
+            return
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        SHED_REQUESTS.labels(self.name, reason).inc()
+        return reason
+
+    def stats(self):
+        return {'concurrency': self.concurrency, 'queue': self.queue, 'deadlineMs': self.deadline_ms,
+                'active': self.active, 'waiting': self.waiting, 'shed': dict(self.shed)}
+
+
+# Limiter per endpoint of an app: the endpoint's own if ADMISSION_<ENDPOINT>_* is set,
+# otherwise its group's
+def build_limiters(endpoints):
+    limiters = {}
+    by_name = {}
+    for endpoint in endpoints:
+        group = ENDPOINT_GROUPS.get(endpoint)
+        name = endpoint if _configured(endpoint) else group
+        if name is None:
+            continue
+        if name not in by_name:
+            by_name[name] = ConcurrencyLimiter(name, **admission_config(name, **DEFAULT_LIMITS.get(group, {})))
+        limiters[endpoint] = by_name[name]
+    return limiters
+
+
+def _shed_response(reason):
+    if reason == 'queue_full':
+        response = jsonify({'error': 'Too many requests for this endpoint; retry shortly'})
+        response.status_code = 429
+    else:
+        response = jsonify({'error': 'Request deadline exceeded while waiting for capacity'})
+        response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def _request_deadline(limiter):
+    deadline_ms = limiter.deadline_ms if limiter is not None and limiter.deadline_ms > 0 else None
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            requested = float(header)
+        except ValueError:
+            requested = None
+        if requested is not None and requested > 0:
+            deadline_ms = requested if deadline_ms is None else min(deadline_ms, requested)
+    return None if deadline_ms is None else time.monotonic() + deadline_ms / 1000
+
+
+# Register the admission hooks, the DeadlineExceeded handler and GET /admission/stats.
+# Call it after the routes are registered: limiters are built for the endpoints present.
+# Limits are per worker process, so with serve.py each worker admits its own share.
+def init_app(app):
+    limiters = build_limiters(list(app.view_functions))
+
+    def before_request():
+        limiter = limiters.get(request.endpoint)
+        deadline = _request_deadline(limiter)
+        _deadline.set(deadline)
+        if limiter is None:
+            return None
+        reason = limiter.acquire(deadline)
+        if reason is not None:
+            logger.warning(f"Shed request to {request.endpoint} ({reason})")
+            return _shed_response(reason)
+        g.admission_limiter = limiter
+        return None
+
+    def teardown_request(exc):
+        limiter = g.pop('admission_limiter', None)
+        if limiter is not None:
+            limiter.release()
+        _deadline.set(None)
+
+    # Raised by work that outlived the deadline, e.g. a wait on a micro-batcher
+    def deadline_exceeded(e):
+        limiter = limiters.get(request.endpoint)
+        SHED_REQUESTS.labels(limiter.name if limiter else request.endpoint or 'unmatched', 'deadline').inc()
+        response = jsonify({'error': str(e) or 'Request deadline exceeded'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def admission_stats():
+        unique = {limiter.name: limiter for limiter in limiters.values()}
+        return jsonify({
+            'limits': {name: limiter.stats() for name, limiter in unique.items()},
+            'endpoints': {endpoint: limiter.name for endpoint, limiter in limiters.items()},
+        })
+
+    app.before_request(before_request)
+    app.teardown_request(teardown_request)
+    app.register_error_handler(DeadlineExceeded, deadline_exceeded)
+    app.add_url_rule('/admission/stats', 'admission_stats', admission_stats, methods=['GET'])
@@ -1,187 +1,503 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
-from tensorflow.keras.preprocessing import image
 import numpy as np
-from PIL import Image
-from prophet import Prophet
 import pandas as pd
 import joblib
+import os
+import time
+import atexit
+import threading
 import logging
-from transformers import pipeline
+from forecast_cache import MAX_FORECAST_DAYS, ForecastCache
+from forecast_gap import GAP_CACHE_SIZE, RESAMPLE_RULES, forecast_gap
+from response_encoding import negotiated, table_response
+from batching import MicroBatcher
+from admission import init_app as init_admission
+from caching import ImageResultCache, LRUCache, SentimentMemo
+from model_registry import ModelRegistry
+from model_admin import init_app as init_model_admin
+from memory_budget import MEMORY_BUDGET, init_app as init_memory_report, trim_prophet
+from forecast_refit import RefitManager, init_app as init_forecast_refit
+from model_checks import (
+    check_embedding_model, check_food_head, check_forecast_model, check_image_model, check_sentiment_analyzer,
+    check_traffic_model
+)
+from metrics import init_app as init_metrics, model_not_loaded, observe_stage, stage
+from inference_backends import backend_config, load_keras_backend, load_sentiment_backend, sample_images
+from image_preprocessing import MAX_IMAGE_BYTES, ImageTooLarge, decode_image
+from imagenet_labels import IMAGENET_CLASS_INDEX_PATH, load_imagenet_labels, top_classes
+from food_embeddings import (
+    CLASS_INDICES_PATH, DUPLICATE_THRESHOLD, FOOD_HEAD_PATH, FOOD_INDEX_PATH, MAX_SIMILAR, EmbeddingIndex, FoodHead,
+    build_embedding_model
+)
+from route_duration import MAX_BATCH_LEGS, LegEncoder, predict_route_durations
+from satisfaction import (
+    MAX_BATCH_ITEMS, combine_scores, compute_satisfaction_scores, rating_only_score, sentiment_to_score
+)
 
 app = Flask(__name__)
 
+# Largest request body: an image upload plus its multipart framing. Werkzeug stops
+# reading a larger body while streaming it, before anything is spooled.
+MAX_REQUEST_BYTES = MAX_IMAGE_BYTES + 64 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Request body must be at most {MAX_REQUEST_BYTES} bytes'}), 413
+
 # Configure CORS to allow requests from the frontend
 CORS(app, resources={r"*": {"origins": "http://localhost:5173"}})
 
+# Request latency, stage timings and error counters, served at /metrics
+init_metrics(app)
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load the pre-trained image analysis model
-model = MobileNetV2(weights='imagenet')
-
-# Load Prophet models for forecasting
-try:
-    model_donations = joblib.load('donation_forecast_model2.pkl')
-    model_requests = joblib.load('request_forecast_model2.pkl')
-except FileNotFoundError as e:
-    logger.error(f"Failed to load Prophet models: {e}")
-    model_donations = None
-    model_requests = None
+# Models are loaded on first use (or by the warm-up thread below) so the app starts
+# serving immediately; TensorFlow, Prophet and transformers are only imported by the loaders
+registry = ModelRegistry()
+
+# Precompute forecasts so the routes only slice cached results
+donation_forecast_cache = ForecastCache('donation')
+request_forecast_cache = ForecastCache('request')
+# /forecast/gap tables keyed by both model versions, horizon and frequency
+forecast_gap_cache = LRUCache(GAP_CACHE_SIZE)
+
+# Class descriptions for the image model's scores, read once (retried while missing)
+imagenet_labels = None
+imagenet_labels_lock = threading.Lock()
+
+def get_imagenet_labels():
+    global imagenet_labels
+    with imagenet_labels_lock:
+        if imagenet_labels is None:
+            try:
+                imagenet_labels = load_imagenet_labels(IMAGENET_CLASS_INDEX_PATH)
+            except Exception as e:
+                logger.error(f"Failed to load the ImageNet class index: {e}")
+        return imagenet_labels
+
+# Load the pre-trained image analysis model on the configured inference backend
+def load_image_model():
+    get_imagenet_labels()
+    def build():
+        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+        return MobileNetV2(weights='imagenet')
+    return load_keras_backend('mobilenet', build, representative_data=lambda: sample_images(200))
+
+# MobileNetV2 embeddings for the Food-101 head and the donation photo index
+def load_food_embedding_model():
+    return load_keras_backend('food_embedding', build_embedding_model, representative_data=lambda: sample_images(200))
+
+def load_food_head():
+    return FoodHead.load(FOOD_HEAD_PATH, CLASS_INDICES_PATH, dtype=np.float16 if MEMORY_BUDGET else np.float32)
+
+# Load Prophet models for forecasting; in memory-budget mode without their training data
+def load_forecast_model(path):
+    model = joblib.load(path)
+    return trim_prophet(model) if MEMORY_BUDGET else model
+
+def load_donation_forecast_model():
+    return load_forecast_model('donation_forecast_model2.pkl')
+
+def load_request_forecast_model():
+    return load_forecast_model('request_forecast_model2.pkl')
 
 # Load traffic prediction model, weather encoder, and vehicle encoder
-try:
+def load_traffic_model():
     traffic_model = joblib.load('traffic_model.pkl')
     weather_encoder = joblib.load('weather_encoder.pkl')
     vehicle_encoder = joblib.load('vehicle_encoder.pkl')
-except FileNotFoundError as e:
-    logger.error(f"Failed to load traffic model or encoders: {e}")
-    traffic_model = None
-    weather_encoder = None
-    vehicle_encoder = None
-
-# Initialize sentiment analysis pipeline
-try:
-    sentiment_analyzer = pipeline('sentiment-analysis', model='distilbert-base-uncased-finetuned-sst-2-english')
-except Exception as e:
-    logger.error(f"Failed to initialize sentiment analyzer: {e}")
-    sentiment_analyzer = None
+    return traffic_model, weather_encoder, vehicle_encoder, LegEncoder(weather_encoder, vehicle_encoder)
+
+# Initialize sentiment analysis pipeline on the configured inference backend
+def load_sentiment_analyzer():
+    return load_sentiment_backend('distilbert-base-uncased-finetuned-sst-2-english')
+
+# Models with artifact files are reloaded when the files change (or on POST /admin/reload).
+# A new version is smoke-tested alongside the old one and only then swapped in.
+# TensorFlow and PyTorch models are not fork-safe: serve.py loads them in every worker.
+registry.register('mobilenet', load_image_model, smoke_test=check_image_model, fork_safe=False)
+registry.register('food_embedding', load_food_embedding_model, smoke_test=check_embedding_model, fork_safe=False)
+registry.register('food_head', load_food_head, paths=[FOOD_HEAD_PATH, CLASS_INDICES_PATH], smoke_test=check_food_head)
+registry.register('donation_forecast', load_donation_forecast_model, paths=['donation_forecast_model2.pkl'],
+                  smoke_test=lambda model: check_forecast_model(model, donation_forecast_cache),
+                  activate=donation_forecast_cache.install)
+registry.register('request_forecast', load_request_forecast_model, paths=['request_forecast_model2.pkl'],
+                  smoke_test=lambda model: check_forecast_model(model, request_forecast_cache),
+                  activate=request_forecast_cache.install)
+registry.register('traffic', load_traffic_model, paths=['traffic_model.pkl', 'weather_encoder.pkl', 'vehicle_encoder.pkl'],
+                  smoke_test=check_traffic_model)
+registry.register('sentiment', load_sentiment_analyzer, smoke_test=check_sentiment_analyzer,
+                  activate=lambda analyzer, prepared: reset_sentiment_memo(), fork_safe=False)
+
+# X-Model-Version on every response and the POST /admin/reload route
+init_model_admin(app, registry)
+
+# GET /health/memory: process RSS and the memory held by each model
+init_memory_report(app, registry)
+
+# POST /forecast/ingest stores new daily counts and refits the Prophet models in the
+# background; GET /forecast/status reports fit times and data freshness
+refit_manager = RefitManager(registry)
+init_forecast_refit(app, refit_manager)
+
+# Batch concurrent image classifications into a single forward pass
+def classify_images(img_arrays):
+    return list(registry.get('mobilenet').predict(np.stack(img_arrays), verbose=0))
+
+image_batcher = MicroBatcher.from_env('mobilenet', classify_images, max_batch_size=16, max_wait_ms=10)
+
+# Cache /analyze results by image content so repeat uploads skip decoding and inference
+image_result_cache = ImageResultCache(
+    maxsize=int(os.environ.get('IMAGE_CACHE_SIZE', 1024)),
+    disk_dir=os.environ.get('IMAGE_CACHE_DIR') or None
+)
+
+# Batch concurrent food photo embeddings into a single forward pass
+def embed_images(img_arrays):
+    return list(registry.get('food_embedding').predict(np.stack(img_arrays), verbose=0))
+
+embedding_batcher = MicroBatcher.from_env('food_embedding', embed_images, max_batch_size=16, max_wait_ms=10)
+
+# Embeddings by image content and model version, so a repeat upload skips inference
+food_embedding_cache = LRUCache(int(os.environ.get('FOOD_EMBEDDING_CACHE_SIZE', 1024)))
+
+# Embeddings of indexed donation photos for near-duplicate checks and similar items
+food_index = EmbeddingIndex(FOOD_INDEX_PATH or None)
+
+# Batch concurrent sentiment calls into a single padded forward pass
+def analyze_comments(comments):
+    return registry.get('sentiment')(comments, batch_size=len(comments), truncation=True)
+
+sentiment_batcher = MicroBatcher.from_env('sentiment', analyze_comments, max_batch_size=32, max_wait_ms=5)
+
+# Memoize sentiment results for repeated comments, optionally persisted for warm starts
+sentiment_memo = SentimentMemo(
+    maxsize=int(os.environ.get('SENTIMENT_MEMO_SIZE', 10000)),
+    path=os.environ.get('SENTIMENT_MEMO_PATH') or None
+)
+
+# Persist the memo and the photo index on exit. serve.py registers this in the workers
+# only: the parent process never changes them.
+def save_state():
+    sentiment_memo.save()
+    food_index.save()
+
+atexit.register(save_state)
+
+# Results memoized for a previous sentiment model are stale once a new one is swapped in
+def reset_sentiment_memo():
+    if registry.models['sentiment'].generation:
+        sentiment_memo.clear()
 
 # Function to compute satisfaction score
 def compute_satisfaction_score(rating, comment):
     try:
-        # Normalize rating (1-5) to (0-100)
-        normalized_rating = ((rating - 1) / 4) * 100
-
         # Perform sentiment analysis on the comment
         sentiment_score = 50  # Default to neutral if sentiment analysis fails
-        if sentiment_analyzer:
-            result = sentiment_analyzer(comment)[0]
+        if registry.get('sentiment'):
+            result = sentiment_memo.get(comment)
+            if result is None:
+                result = sentiment_batcher.submit(comment)
+                sentiment_memo.put(comment, result)
             # Convert sentiment score to 0-100 scale
-            sentiment_score = (result['score'] * 100) if result['label'] == 'POSITIVE' else ((1 - result['score']) * 100)
+            sentiment_score = sentiment_to_score(result)
 
         # Weighted combination: 60% rating, 40% sentiment
-        satisfaction_score = (0.6 * normalized_rating) + (0.4 * sentiment_score)
-        return round(max(0, min(100, satisfaction_score)))
+        return combine_scores(rating, sentiment_score)
     except Exception as e:
         logger.error(f"Error computing satisfaction score: {e}")
         # Fallback to rating-based score
-        return round(((rating - 1) / 4) * 100)
+        return rating_only_score(rating)
 
 # Route for image analysis
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+    with stage('validation'):
+        # Reject oversized uploads before the multipart body is parsed; bodies without a
+        # length are cut off at MAX_CONTENT_LENGTH while streaming
+        if request.content_length and request.content_length > MAX_REQUEST_BYTES:
+            return jsonify({'error': f'Image must be at most {MAX_IMAGE_BYTES} bytes'}), 413
 
-    file = request.files['file']
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
 
+    file = request.files['file']
+    data = file.read(MAX_IMAGE_BYTES + 1)
+
+    if not registry.get('mobilenet'):
+        return model_not_loaded('Image analysis model not loaded')
+
+    # Return the cached predictions for an image we have already classified with this model.
+    # MobileNetV2 has no artifact files to version it, and the disk tier is shared with
+    # workers that may run it on another backend, so the backend is part of the key too.
+    backend, quantization = backend_config('mobilenet')
+    cache_key = image_result_cache.key(data, f"{registry.version('mobilenet')}-{backend}-{quantization}")
+    cached = image_result_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+    labels = get_imagenet_labels()
+    if labels is None:
+        return model_not_loaded('ImageNet class index not available')
+
+    decode_start = time.perf_counter()
     try:
-        img = Image.open(file.stream).convert('RGB').resize((224, 224))
+        img_array = decode_image(data)
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         logger.error(f"Error opening image: {e}")
         return jsonify({'error': f'Failed to process image: {str(e)}'}), 400
+    decode_seconds = time.perf_counter() - decode_start
+    observe_stage('preprocessing', decode_seconds)
+
+    inference_start = time.perf_counter()
+    predictions = image_batcher.submit(img_array)
+    inference_seconds = time.perf_counter() - inference_start
+    observe_stage('inference', inference_seconds)
+    results = [{'description': desc, 'confidence': prob} for desc, prob in top_classes(predictions, labels)]
+    image_result_cache.put(cache_key, results)
+    response = jsonify(results)
+    # Report decode and inference time separately without changing the response body
+    response.headers['Server-Timing'] = (
+        f'decode;dur={decode_seconds * 1000:.1f}, inference;dur={inference_seconds * 1000:.1f}'
+    )
+    return response
+
+def parse_similar_count(value):
+    k = int(value)
+    if k < 1 or k > MAX_SIMILAR:
+        raise ValueError(f'k must be between 1 and {MAX_SIMILAR}')
+    return k
+
+# Route for Food-101 classification and similar donation photos. The image is embedded
+# once; the embedding is scored by the food head and matched against the photo index.
+# With an "id" form field the photo is also added to the index, so later lookups by id
+# need no inference. Without the head, only the similarity results are returned.
+@app.route('/analyze/food', methods=['POST'])
+def analyze_food():
+    with stage('validation'):
+        # Reject oversized uploads before the multipart body is parsed; bodies without a
+        # length are cut off at MAX_CONTENT_LENGTH while streaming
+        if request.content_length and request.content_length > MAX_REQUEST_BYTES:
+            return jsonify({'error': f'Image must be at most {MAX_IMAGE_BYTES} bytes'}), 413
+
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        item_id = request.form.get('id') or None
+        try:
+            k = parse_similar_count(request.form.get('k', 5))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid k: {str(e)}'}), 400
+
+    data = request.files['file'].read(MAX_IMAGE_BYTES + 1)
 
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
+    if not registry.get('food_embedding'):
+        return model_not_loaded('Food embedding model not loaded')
 
-    predictions = model.predict(img_array)
-    decoded = decode_predictions(predictions, top=3)[0]
+    cache_key = ImageResultCache.key(data, registry.version('food_embedding'))
+    embedding = food_embedding_cache.get(cache_key)
+    if embedding is None:
+        try:
+            with stage('preprocessing'):
+                img_array = decode_image(data)
+        except ImageTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except Exception as e:
+            logger.error(f"Error opening image: {e}")
+            return jsonify({'error': f'Failed to process image: {str(e)}'}), 400
+        with stage('inference'):
+            # Copied out of the batch output so the cache does not keep the whole batch alive
+            embedding = np.array(embedding_batcher.submit(img_array), dtype=np.float32)
+        food_embedding_cache.put(cache_key, embedding)
 
-    results = [{'description': desc, 'confidence': float(prob)} for (_, desc, prob) in decoded]
-    return jsonify(results)
+    try:
+        head = registry.get('food_head')
+        predictions = head.top(embedding) if head else None
+        with stage('search'):
+            similar = food_index.search(embedding, k, exclude=item_id)
+        duplicate = similar[0] if similar and similar[0]['similarity'] >= DUPLICATE_THRESHOLD else None
+        if item_id:
+            food_index.add(item_id, embedding, predictions[0]['label'] if predictions else None)
+    except Exception as e:
+        logger.error(f"Error in food image analysis: {e}")
+        return jsonify({'error': f'Failed to analyze food image: {str(e)}'}), 500
+
+    return jsonify({'predictions': predictions, 'similar': similar, 'duplicate': duplicate, 'indexed': bool(item_id)})
+
+# Route for items similar to an indexed photo, from its stored embedding
+@app.route('/analyze/food/<item_id>/similar', methods=['GET'])
+def similar_food(item_id):
+    embedding = food_index.embedding(item_id)
+    if embedding is None:
+        return jsonify({'error': f'No indexed photo with id "{item_id}"'}), 404
+    with stage('validation'):
+        try:
+            k = parse_similar_count(request.args.get('k', 5))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid k: {str(e)}'}), 400
+    with stage('search'):
+        similar = food_index.search(embedding, k, exclude=item_id)
+    return jsonify({'id': item_id, 'similar': similar})
+
+# Route for dropping a photo from the index, e.g. when its donation is deleted
+@app.route('/analyze/food/<item_id>', methods=['DELETE'])
+def remove_food(item_id):
+    if not food_index.remove(item_id):
+        return jsonify({'error': f'No indexed photo with id "{item_id}"'}), 404
+    return jsonify({'removed': item_id})
+
+# Route for cache hit/miss counters
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'image': image_result_cache.stats(), 'sentiment': sentiment_memo.stats(),
+                    'forecastGap': forecast_gap_cache.stats(), 'foodEmbedding': food_embedding_cache.stats(),
+                    'foodIndex': food_index.stats()})
+
+# Route for readiness: reports which models are loaded and how long each load took
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    ready = registry.ready()
+    return jsonify({'ready': ready, 'models': registry.status()}), 200 if ready else 503
 
 # Route for donation forecasting
 @app.route('/forecast/donations', methods=['GET'])
+@negotiated
 def forecast_donations():
+    model_donations = registry.get('donation_forecast')
     if not model_donations:
-        return jsonify({'error': 'Donation forecast model not loaded'}), 500
+        return model_not_loaded('Donation forecast model not loaded')
 
     try:
-        days = int(request.args.get('days', 30))
-        if days <= 0:
-            return jsonify({'error': 'Days must be a positive integer'}), 400
-
-        future = model_donations.make_future_dataframe(periods=days)
-        forecast = model_donations.predict(future)
-        forecast_data = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(days)
-        forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
-        return jsonify(forecast_data.to_dict(orient='records'))
+        with stage('validation'):
+            days = int(request.args.get('days', 30))
+            if days <= 0 or days > MAX_FORECAST_DAYS:
+                return jsonify({'error': f'Days must be an integer between 1 and {MAX_FORECAST_DAYS}'}), 400
+
+        with stage('inference'):
+            forecast_data = donation_forecast_cache.get(model_donations, days)
+        with stage('serialization'):
+            forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
+            response = table_response(forecast_data)
+        return response
     except Exception as e:
         logger.error(f"Error in donation forecast: {e}")
         return jsonify({'error': f'Failed to generate donation forecast: {str(e)}'}), 500
 
 # Route for request forecasting
 @app.route('/forecast/requests', methods=['GET'])
+@negotiated
 def forecast_requests():
+    model_requests = registry.get('request_forecast')
     if not model_requests:
-        return jsonify({'error': 'Request forecast model not loaded'}), 500
+        return model_not_loaded('Request forecast model not loaded')
 
     try:
-        days = int(request.args.get('days', 30))
-        if days <= 0:
-            return jsonify({'error': 'Days must be a positive integer'}), 400
-
-        future = model_requests.make_future_dataframe(periods=days)
-        forecast = model_requests.predict(future)
-        forecast_data = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(days)
-        forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
-        return jsonify(forecast_data.to_dict(orient='records'))
+        with stage('validation'):
+            days = int(request.args.get('days', 30))
+            if days <= 0 or days > MAX_FORECAST_DAYS:
+                return jsonify({'error': f'Days must be an integer between 1 and {MAX_FORECAST_DAYS}'}), 400
+
+        with stage('inference'):
+            forecast_data = request_forecast_cache.get(model_requests, days)
+        with stage('serialization'):
+            forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
+            response = table_response(forecast_data)
+        return response
     except Exception as e:
         logger.error(f"Error in request forecast: {e}")
         return jsonify({'error': f'Failed to generate request forecast: {str(e)}'}), 500
 
+# Route for donations, requests and their gap in one response, optionally resampled
+# to weekly or monthly totals
+@app.route('/forecast/gap', methods=['GET'])
+@negotiated
+def forecast_supply_gap():
+    model_donations = registry.get('donation_forecast')
+    model_requests = registry.get('request_forecast')
+    if not model_donations or not model_requests:
+        return model_not_loaded('Donation or request forecast model not loaded')
+
+    try:
+        with stage('validation'):
+            days = int(request.args.get('days', 30))
+            if days <= 0 or days > MAX_FORECAST_DAYS:
+                return jsonify({'error': f'Days must be an integer between 1 and {MAX_FORECAST_DAYS}'}), 400
+            freq = request.args.get('freq', 'day')
+            if freq not in RESAMPLE_RULES:
+                return jsonify({'error': f'freq must be one of: {", ".join(RESAMPLE_RULES)}'}), 400
+
+        key = (registry.version('donation_forecast'), registry.version('request_forecast'), days, freq)
+        gap = forecast_gap_cache.get(key)
+        if gap is None:
+            with stage('inference'):
+                donation_data = donation_forecast_cache.get(model_donations, days)
+                request_data = request_forecast_cache.get(model_requests, days)
+                gap = forecast_gap(donation_data, request_data, freq)
+            forecast_gap_cache.put(key, gap)
+        with stage('serialization'):
+            response = table_response(gap, {'days': days, 'freq': freq}, 'periods')
+        return response
+    except Exception as e:
+        logger.error(f"Error in forecast gap: {e}")
+        return jsonify({'error': f'Failed to generate forecast gap: {str(e)}'}), 500
+
 # Route for predicting route duration
 @app.route('/predict_duration', methods=['POST'])
 def predict_duration():
-    if not traffic_model or not weather_encoder or not vehicle_encoder:
-        return jsonify({'error': 'Traffic prediction model or encoders not loaded'}), 500
+    traffic = registry.get('traffic')
+    if not traffic:
+        return model_not_loaded('Traffic prediction model or encoders not loaded')
+    traffic_model, weather_encoder, vehicle_encoder, leg_encoder = traffic
 
     try:
         data = request.get_json()
-        logger.info(f"Received data for duration prediction: {data}")
-
-        # Validate required fields
-        required_fields = ['distance', 'osrmDuration', 'hour', 'weather', 'vehicleType']
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
-
-        distance = float(data['distance'])  # in km
-        osrm_duration = float(data['osrmDuration'])  # in seconds
-        hour = int(data['hour'])
-        weather = data['weather'].title()  # e.g., 'Clear', 'Clouds'
-        vehicle_type = data['vehicleType'].title()  # e.g., 'Car', 'Motorcycle'
-
-        # Validate input ranges
-        if distance <= 0:
-            return jsonify({'error': 'Distance must be positive'}), 400
-        if osrm_duration <= 0:
-            return jsonify({'error': 'OSRM duration must be positive'}), 400
-        if hour < 0 or hour > 23:
-            return jsonify({'error': 'Hour must be between 0 and 23'}), 400
-
-        # Validate weather category
-        known_weather_categories = weather_encoder.classes_
-        if weather not in known_weather_categories:
-            return jsonify({
-                'error': f'Invalid weather value: "{weather}". Expected one of: {", ".join(known_weather_categories)}'
-            }), 400
-
-        # Validate vehicle type
-        known_vehicle_types = vehicle_encoder.classes_
-        if vehicle_type not in known_vehicle_types:
-            return jsonify({
-                'error': f'Invalid vehicle type: "{vehicle_type}". Expected one of: {", ".join(known_vehicle_types)}'
-            }), 400
+        logger.debug('Received data for duration prediction: %s', data)
+
+        with stage('validation'):
+            # Validate required fields
+            required_fields = ['distance', 'osrmDuration', 'hour', 'weather', 'vehicleType']
+            missing_fields = [field for field in required_fields if field not in data]
+            if missing_fields:
+                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+
+            distance = float(data['distance'])  # in km
+            osrm_duration = float(data['osrmDuration'])  # in seconds
+            hour = int(data['hour'])
+            weather = data['weather'].title()  # e.g., 'Clear', 'Clouds'
+            vehicle_type = data['vehicleType'].title()  # e.g., 'Car', 'Motorcycle'
+
+            # Validate input ranges
+            if distance <= 0:
+                return jsonify({'error': 'Distance must be positive'}), 400
+            if osrm_duration <= 0:
+                return jsonify({'error': 'OSRM duration must be positive'}), 400
+            if hour < 0 or hour > 23:
+                return jsonify({'error': 'Hour must be between 0 and 23'}), 400
+
+            # Validate weather category
+            known_weather_categories = weather_encoder.classes_
+            if weather not in known_weather_categories:
+                return jsonify({
+                    'error': f'Invalid weather value: "{weather}". Expected one of: {", ".join(known_weather_categories)}'
+                }), 400
+
+            # Validate vehicle type
+            known_vehicle_types = vehicle_encoder.classes_
+            if vehicle_type not in known_vehicle_types:
+                return jsonify({
+                    'error': f'Invalid vehicle type: "{vehicle_type}". Expected one of: {", ".join(known_vehicle_types)}'
+                }), 400
 
         # Encode features
-        weather_encoded = weather_encoder.transform([weather])[0]
-        vehicle_encoded = vehicle_encoder.transform([vehicle_type])[0]
-        logger.info(f"Encoded values: weather={weather_encoded}, vehicle_type={vehicle_encoded}")
+        weather_encoded = leg_encoder.weather_codes[weather]
+        vehicle_encoded = leg_encoder.vehicle_codes[vehicle_type]
+        logger.debug('Encoded values: weather=%s, vehicle_type=%s', weather_encoded, vehicle_encoded)
 
         # Normalize features
         distance_meters = distance * 1000  # Convert km to meters
@@ -190,12 +506,13 @@ def predict_duration():
 
         # Prepare features for prediction
         features = np.array([[distance_meters, osrm_duration_minutes, hour_normalized, weather_encoded, vehicle_encoded]])
-        logger.info(f"Normalized features for prediction: {features}")
+        logger.debug('Normalized features for prediction: %s', features)
 
         # Make prediction using the traffic model
         try:
-            predicted_duration = traffic_model.predict(features)[0]
-            logger.info(f"Model predicted duration (minutes): {predicted_duration}")
+            with stage('inference'):
+                predicted_duration = traffic_model.predict(features)[0]
+            logger.debug('Model predicted duration (minutes): %s', predicted_duration)
             predicted_duration = predicted_duration * 60  # Convert minutes to seconds
         except Exception as e:
             logger.error(f"Model prediction failed: {e}")
@@ -203,7 +520,7 @@ def predict_duration():
 
         # Ensure positive duration
         predicted_duration = max(predicted_duration, 60)  # Minimum 1 minute
-        logger.info(f"Final predicted duration (seconds): {predicted_duration}")
+        logger.debug('Final predicted duration (seconds): %s', predicted_duration)
 
         return jsonify({'predictedDuration': float(predicted_duration)})
     except ValueError as ve:
@@ -213,37 +530,101 @@ def predict_duration():
         logger.error(f"Error in duration prediction: {e}")
         return jsonify({'error': f'Failed to predict duration: {str(e)}'}), 500
 
+# Route for predicting durations of many legs across candidate routes in one pass
+@app.route('/predict_duration/batch', methods=['POST'])
+def predict_duration_batch():
+    traffic = registry.get('traffic')
+    if not traffic:
+        return model_not_loaded('Traffic prediction model or encoders not loaded')
+    traffic_model, _, _, leg_encoder = traffic
+    try:
+        data = request.get_json()
+        with stage('validation'):
+            # Accept {"routes": [{"legs": [...]}, ...]} or a single route as {"legs": [...]}
+            if isinstance(data, dict) and 'routes' in data:
+                routes = data['routes']
+            else:
+                routes = [data] if isinstance(data, dict) and 'legs' in data else None
+            if not isinstance(routes, list) or not routes:
+                return jsonify({'error': 'Expected "routes" as a non-empty list of {"legs": [...]} objects'}), 400
+            if not all(isinstance(route, dict) and isinstance(route.get('legs'), list) for route in routes):
+                return jsonify({'error': 'Each route must be an object with a "legs" list'}), 400
+            leg_count = sum(len(route['legs']) for route in routes)
+            if leg_count > MAX_BATCH_LEGS:
+                return jsonify({'error': f'At most {MAX_BATCH_LEGS} legs can be predicted per request'}), 400
+        logger.info(f"Received {len(routes)} routes with {leg_count} legs for duration prediction")
+
+        with stage('inference'):
+            results = predict_route_durations(traffic_model, leg_encoder, [route['legs'] for route in routes])
+        return jsonify({'routes': results})
+    except Exception as e:
+        logger.error(f"Error in batch duration prediction: {e}")
+        return jsonify({'error': f'Failed to predict durations: {str(e)}'}), 500
+
 # Route for computing satisfaction score
 @app.route('/compute_satisfaction', methods=['POST'])
 def compute_satisfaction():
     try:
         data = request.get_json()
-        logger.info(f"Received data for satisfaction score: {data}")
+        logger.debug('Received data for satisfaction score: %s', data)
 
-        # Validate required fields
-        required_fields = ['rating', 'comment']
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        with stage('validation'):
+            # Validate required fields
+            required_fields = ['rating', 'comment']
+            missing_fields = [field for field in required_fields if field not in data]
+            if missing_fields:
+                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
 
-        rating = data['rating']
-        comment = data['comment']
+            rating = data['rating']
+            comment = data['comment']
 
-        # Validate rating
-        if not isinstance(rating, (int, float)) or rating < 1 or rating > 5:
-            return jsonify({'error': 'Rating must be a number between 1 and 5'}), 400
+            # Validate rating
+            if not isinstance(rating, (int, float)) or rating < 1 or rating > 5:
+                return jsonify({'error': 'Rating must be a number between 1 and 5'}), 400
 
-        # Validate comment
-        if not isinstance(comment, str) or not comment.strip():
-            return jsonify({'error': 'Comment must be a non-empty string'}), 400
+            # Validate comment
+            if not isinstance(comment, str) or not comment.strip():
+                return jsonify({'error': 'Comment must be a non-empty string'}), 400
 
         # Compute satisfaction score
-        satisfaction_score = compute_satisfaction_score(rating, comment)
+        with stage('inference'):
+            satisfaction_score = compute_satisfaction_score(rating, comment)
 
         return jsonify({'satisfactionScore': satisfaction_score})
     except Exception as e:
         logger.error(f"Error in satisfaction score computation: {e}")
         return jsonify({'error': f'Failed to compute satisfaction score: {str(e)}'}), 500
 
+# Route for computing satisfaction scores in bulk
+@app.route('/compute_satisfaction/batch', methods=['POST'])
+@negotiated
+def compute_satisfaction_batch():
+    try:
+        data = request.get_json()
+        with stage('validation'):
+            items = data.get('items') if isinstance(data, dict) else None
+            if not isinstance(items, list) or not items:
+                return jsonify({'error': 'Items must be a non-empty list of {rating, comment} objects'}), 400
+            if len(items) > MAX_BATCH_ITEMS:
+                return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items can be scored per request'}), 400
+        logger.info(f"Received {len(items)} items for batch satisfaction scoring")
+
+        # Invalid items are reported individually and do not fail the batch
+        with stage('inference'):
+            results = compute_satisfaction_scores(registry.get('sentiment'), items, memo=sentiment_memo)
+
+        return table_response(results, key='results')
+    except Exception as e:
+        logger.error(f"Error in batch satisfaction score computation: {e}")
+        return jsonify({'error': f'Failed to compute satisfaction scores: {str(e)}'}), 500
+
+# Per-endpoint concurrency limits, wait queues and deadlines, set up for the routes above
+init_admission(app)
+
+# Start loading models in the background without blocking startup
+registry.warm_up()
+registry.watch()
+
+# Development server; use serve.py for production
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
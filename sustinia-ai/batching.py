@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+from admission import DeadlineExceeded, check_deadline, remaining_time
+
+logger = logging.getLogger(__name__)
+
+
+# Batch size and wait time for a model, overridable with
+# BATCH_<NAME>_MAX_SIZE and BATCH_<NAME>_MAX_WAIT_MS
+def batcher_config(name, max_batch_size=16, max_wait_ms=5):
+    prefix = f'BATCH_{name.upper()}'
+    return {
+        'max_batch_size': int(os.environ.get(f'{prefix}_MAX_SIZE', max_batch_size)),
+        'max_wait_ms': float(os.environ.get(f'{prefix}_MAX_WAIT_MS', max_wait_ms)),
+    }
+
+
+# Collects single inference calls from concurrent requests and runs them as one batch.
+# predict_batch receives a list of items and must return one result per item, in order.
+# A batch is flushed when it reaches max_batch_size or when the oldest queued call has
+# waited max_wait_ms; each caller blocks until its own result is ready.
+class MicroBatcher:
+    def __init__(self, name, predict_batch, max_batch_size=16, max_wait_ms=5):
+        self.name = name
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls, name, predict_batch, **defaults):
+        return cls(name, predict_batch, **batcher_config(name, **defaults))
+
+    # Waits at most until the current request's deadline; on DeadlineExceeded the call
+    # is dropped from the queue if its batch has not started yet
+    def submit(self, item):
+        check_deadline(f'{self.name} inference')
+        # Batching disabled: run inline without the worker thread
+        if self.max_batch_size <= 1:
+            return self.predict_batch([item])[0]
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        try:
+            return future.result(timeout=remaining_time())
+        except TimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(f'Deadline exceeded waiting for {self.name} inference')
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name=f'batcher-{self.name}', daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Skip calls whose caller gave up at its deadline
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if batch:
+                self._predict(batch)
+
+    def _predict(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.predict_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f'{self.name} returned {len(results)} results for {len(items)} inputs')
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Batched {self.name} inference failed: {e}")
+                batch[0][1].set_exception(e)
+                return
+            # One bad input fails the whole batch: run the calls one at a time so only it fails
+            logger.warning(f"Batched {self.name} inference failed, retrying {len(batch)} calls one at a time: {e}")
+            for call in batch:
+                self._predict([call])
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
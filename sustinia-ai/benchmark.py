@@ -0,0 +1,508 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import platform
+import importlib
+import threading
+import subprocess
+import logging
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference_backends import SAMPLE_COMMENTS, sample_food_events
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WEATHER_CLASSES = ['Clear', 'Clouds', 'Rain']
+VEHICLE_CLASSES = ['Bicycle', 'Car', 'Motorcycle', 'Scooter', 'Truck', 'Van']
+
+LATENCY_KEYS = ['p50', 'p95', 'p99']
+
+# Statuses of requests shed by admission control (queue full, deadline passed)
+SHED_STATUSES = (429, 503)
+
+
+# Lightweight stand-ins for the real models. They return outputs of the right shape
+# almost instantly, so a stub run measures the service itself: request parsing,
+# preprocessing, batching, caching and serialization.
+
+class StubImageModel:
+    def predict(self, inputs, verbose=0, batch_size=None):
+        inputs = np.asarray(inputs)
+        scores = np.full((len(inputs), 1000), 1e-4, dtype=np.float32)
+        # Derive the top classes from the pixels so different images get different labels
+        top = (np.abs(inputs.reshape(len(inputs), -1)).mean(axis=1) * 997).astype(int) % 1000
+        scores[np.arange(len(inputs)), top] = 0.9
+        return scores
+
+
+class StubEmbeddingModel:
+    # Channel means of a coarse grid, so similar images get similar embeddings
+    def predict(self, inputs, verbose=0, batch_size=None):
+        inputs = np.asarray(inputs, dtype=np.float32)
+        grid = inputs.reshape(len(inputs), 8, 28, 8, 28, 3).mean(axis=(2, 4))
+        return np.tile(grid.reshape(len(inputs), -1), (1, 7))[:, :1280] + 1.0
+
+
+def stub_food_head():
+    from food_embeddings import FoodHead, load_class_names
+    class_names = load_class_names(os.path.join(BASE_DIR, 'class_indices.json'))
+    rng = np.random.default_rng(0)
+    return FoodHead(rng.normal(size=(1280, len(class_names))), np.zeros(len(class_names)), class_names)
+
+
+class StubForecaster:
+    def make_future_dataframe(self, periods, include_history=True):
+        import pandas as pd
+        return pd.DataFrame({'ds': pd.date_range(pd.Timestamp.today().normalize(), periods=periods + 1, freq='D')[1:]})
+
+    def predict(self, future):
+        yhat = 20 + 5 * np.sin(np.arange(len(future)) * 2 * np.pi / 7)
+        forecast = future.copy()
+        forecast['yhat'] = yhat
+        forecast['yhat_lower'] = yhat - 3
+        forecast['yhat_upper'] = yhat + 3
+        return forecast
+
+
+class StubLabelEncoder:
+    def __init__(self, classes):
+        self.classes_ = np.array(classes)
+
+
+class StubTrafficModel:
+    # Features are [meters, OSRM minutes, hour / 23, weather, vehicle]; predicts minutes
+    def predict(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        return features[:, 1] * (1.0 + 0.2 * features[:, 3])
+
+
+class StubRegressor:
+    def predict(self, inputs, verbose=0, batch_size=None):
+        inputs = np.asarray(inputs, dtype=np.float32)
+        return np.abs(inputs).sum(axis=1, keepdims=True)
+
+
+class StubSentimentAnalyzer:
+    def __call__(self, texts, batch_size=None, truncation=True):
+        if isinstance(texts, str):
+            texts = [texts]
+        return [{'label': 'POSITIVE' if len(text) % 2 else 'NEGATIVE', 'score': 0.9} for text in texts]
+
+
+def stub_traffic():
+    from route_duration import LegEncoder
+    weather_encoder = StubLabelEncoder(WEATHER_CLASSES)
+    vehicle_encoder = StubLabelEncoder(VEHICLE_CLASSES)
+    return StubTrafficModel(), weather_encoder, vehicle_encoder, LegEncoder(weather_encoder, vehicle_encoder)
+
+
+STUB_MODELS = {
+    'mobilenet': StubImageModel,
+    'food_embedding': StubEmbeddingModel,
+    'food_head': stub_food_head,
+    'donation_forecast': StubForecaster,
+    'request_forecast': StubForecaster,
+    'traffic': stub_traffic,
+    'sentiment': StubSentimentAnalyzer,
+    'food_quantity': StubRegressor,
+    'food_waste': StubRegressor,
+}
+
+
+# Replace every registered model of a service with its stub
+def install_stubs(service):
+    for name in list(service.registry.models):
+        if name in STUB_MODELS:
+            service.registry.register(name, STUB_MODELS[name])
+    service.registry.load_all()
+
+
+# Synthetic payloads. Each generator gets its own seeded Random so a run is reproducible,
+# and the index makes every image and comment unique so the result caches do not hide
+# the cost of the model.
+
+def image_payload(rng, index):
+    from PIL import Image
+    width, height = rng.choice([(640, 480), (1280, 960), (800, 800)])
+    noise = np.random.default_rng(rng.getrandbits(32)).integers(0, 256, size=(24, 32, 3), dtype=np.uint8)
+    img = Image.fromarray(noise).resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=85)
+    return {'file': ('food.jpg', buffer.getvalue())}
+
+
+def forecast_payload(rng, index):
+    return {'query': {'days': rng.choice([7, 14, 30, 90])}}
+
+
+def leg_payload(rng, index):
+    return {'json': {
+        'distance': round(rng.uniform(0.5, 40), 2),
+        'osrmDuration': round(rng.uniform(60, 3600), 1),
+        'hour': rng.randint(0, 23),
+        'weather': rng.choice(WEATHER_CLASSES),
+        'vehicleType': rng.choice(VEHICLE_CLASSES),
+    }}
+
+
+def satisfaction_payload(rng, index):
+    return {'json': {'rating': rng.randint(1, 5), 'comment': f'{rng.choice(SAMPLE_COMMENTS)} (order {index})'}}
+
+
+def food_demand_payload(rng, index):
+    event = sample_food_events(1, seed=rng.getrandbits(32))[0]
+    event.pop('Quantity of Food')
+    return {'json': event}
+
+
+def food_waste_payload(rng, index):
+    return {'json': sample_food_events(1, seed=rng.getrandbits(32))[0]}
+
+
+# name -> (method, path, payload generator)
+ENDPOINTS = {
+    'analyze': ('POST', '/analyze', image_payload),
+    'analyze_food': ('POST', '/analyze/food', image_payload),
+    'forecast_donations': ('GET', '/forecast/donations', forecast_payload),
+    'forecast_requests': ('GET', '/forecast/requests', forecast_payload),
+    'predict_duration': ('POST', '/predict_duration', leg_payload),
+    'compute_satisfaction': ('POST', '/compute_satisfaction', satisfaction_payload),
+    'forecast_food_demand': ('POST', '/forecast_food_demand', food_demand_payload),
+    'predict_food_waste': ('POST', '/predict_food_waste', food_waste_payload),
+}
+
+SERVICE_ENDPOINTS = {
+    'app': ['analyze', 'analyze_food', 'forecast_donations', 'forecast_requests', 'predict_duration',
+            'compute_satisfaction'],
+    # ml.py has no image routes
+    'ml': [name for name in ENDPOINTS if not name.startswith('analyze')],
+}
+
+
+# Sends requests to a service loaded in this process, one Flask test client per thread
+class InProcessClient:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, payload):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        kwargs = {'query_string': payload.get('query')}
+        if 'json' in payload:
+            kwargs['json'] = payload['json']
+        if 'file' in payload:
+            filename, data = payload['file']
+            kwargs['data'] = {'file': (io.BytesIO(data), filename)}
+            kwargs['content_type'] = 'multipart/form-data'
+        response = client.open(path, method=method, **kwargs)
+        return response.status_code, response.get_data()
+
+
+# Sends requests to a running service over HTTP
+class HttpClient:
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, payload):
+        url = self.base_url + path
+        if payload.get('query'):
+            url += '?' + urllib.parse.urlencode(payload['query'])
+        headers = {}
+        body = None
+        if 'json' in payload:
+            body = json.dumps(payload['json']).encode()
+            headers['Content-Type'] = 'application/json'
+        if 'file' in payload:
+            filename, data = payload['file']
+            boundary = uuid.uuid4().hex
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        req = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def percentile_summary(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+def make_payloads(name, count, seed, offset=0):
+    generator = ENDPOINTS[name][2]
+    return [generator(random.Random(f'{seed}:{name}:{offset + i}'), offset + i) for i in range(count)]
+
+
+# Fire the payloads at one endpoint from `concurrency` threads and summarize.
+# Throughput and latencies (in milliseconds) cover the 2xx responses only; shed
+# requests and other errors are counted separately.
+def run_level(client, name, payloads, concurrency):
+    method, path, _ = ENDPOINTS[name]
+
+    def timed(payload):
+        start = time.perf_counter()
+        status, _ = client.request(method, path, payload)
+        return status, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, payloads))
+    wall = time.perf_counter() - start
+
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    succeeded = [latency for status, latency in results if 200 <= status < 300]
+    return {
+        'requests': len(results),
+        'succeeded': len(succeeded),
+        'shed': sum(1 for status, _ in results if status in SHED_STATUSES),
+        'errors': sum(1 for status, _ in results if status >= 400 and status not in SHED_STATUSES),
+        'statuses': statuses,
+        'throughput': round(len(succeeded) / wall, 2),
+        'latencyMs': percentile_summary(succeeded) if succeeded else None,
+    }
+
+
+def run_endpoint(client, name, concurrency_levels, requests, warmup, seed):
+    # Warm-up requests load lazy models, fill the forecast caches and start the batchers.
+    # An endpoint that fails all of them is reported as skipped rather than timed.
+    method, path, _ = ENDPOINTS[name]
+    warmup_results = [client.request(method, path, payload) for payload in make_payloads(name, max(warmup, 1), seed, -10 ** 6)]
+    if all(status >= 400 for status, _ in warmup_results):
+        status, body = warmup_results[-1]
+        return {'skipped': f'{status}: {body[:200].decode(errors="replace")}'}
+
+    levels = {}
+    for offset, concurrency in enumerate(concurrency_levels):
+        payloads = make_payloads(name, requests, seed, offset * requests)
+        levels[str(concurrency)] = run_level(client, name, payloads, concurrency)
+        logging.info(f"{name} @ {concurrency}: {levels[str(concurrency)]}")
+    return levels
+
+
+# Micro-benchmarks of the in-process hot paths, in microseconds per call
+def run_micro(repeat, seed):
+    import joblib
+    from caching import normalize_comment
+    from feature_encoder import FeatureEncoder
+    from forecast_cache import ForecastCache
+    from image_preprocessing import decode_image
+    from route_duration import LegEncoder
+
+    rng = random.Random(seed)
+    image = image_payload(rng, 0)['file'][1]
+    encoder = FeatureEncoder(joblib.load(os.path.join(BASE_DIR, 'feature_columns.pkl')),
+                             joblib.load(os.path.join(BASE_DIR, 'scaler.pkl')))
+    event = food_waste_payload(rng, 0)['json']
+    leg_encoder = LegEncoder(StubLabelEncoder(WEATHER_CLASSES), StubLabelEncoder(VEHICLE_CLASSES))
+    leg = leg_payload(rng, 0)['json']
+    forecaster = StubForecaster()
+    forecast_cache = ForecastCache('benchmark')
+    forecast_cache.warm(forecaster)
+    comment = satisfaction_payload(rng, 0)['json']['comment']
+
+    cases = {
+        'decode_image': lambda: decode_image(image),
+        'feature_encoder.transform_one': lambda: encoder.transform_one(event),
+        'leg_encoder.encode': lambda: leg_encoder.encode(leg),
+        'forecast_cache.get': lambda: forecast_cache.get(forecaster, 30),
+        'normalize_comment': lambda: normalize_comment(comment),
+    }
+    results = {}
+    for name, case in cases.items():
+        case()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            case()
+            timings.append((time.perf_counter() - start) * 1e6)
+        results[name] = {'calls': repeat, 'latencyUs': percentile_summary(timings)}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def load_service(service, mode):
+    from admission import DEFAULT_LIMITS
+
+    # Models are loaded (or stubbed) here, not by the service's warm-up or watcher threads
+    os.environ['WARMUP_MODELS'] = 'none'
+    os.environ['MODEL_WATCH_INTERVAL'] = '0'
+    # In-process runs measure the service, not its load shedding: the admission limits
+    # are off unless set explicitly. HTTP runs against serve.py keep the configured ones.
+    for group in DEFAULT_LIMITS:
+        os.environ.setdefault(f'ADMISSION_{group.upper()}_CONCURRENCY', '0')
+    os.chdir(BASE_DIR)
+    module = importlib.import_module(service)
+    if mode == 'stub':
+        install_stubs(module)
+    else:
+        module.registry.load_all()
+    return module
+
+
+def run(args):
+    concurrency_levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    names = [n.strip() for n in args.endpoints.split(',') if n.strip()] if args.endpoints else SERVICE_ENDPOINTS[args.service]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        sys.exit(f'Unknown endpoints: {", ".join(unknown)}. Expected some of: {", ".join(ENDPOINTS)}')
+
+    if args.url:
+        client = HttpClient(args.url)
+        models = None
+    else:
+        module = load_service(args.service, args.mode)
+        # Request logging would dominate the stub timings
+        logging.getLogger().setLevel(args.log_level)
+        client = InProcessClient(module.app)
+        models = module.registry.status()
+
+    results = {
+        'meta': {
+            'service': args.service,
+            'mode': 'http' if args.url else args.mode,
+            'url': args.url,
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpuCount': os.cpu_count(),
+            'requests': args.requests,
+            'concurrency': concurrency_levels,
+            'seed': args.seed,
+            'models': models,
+        },
+        'endpoints': {},
+    }
+    for name in names:
+        print(f'Benchmarking {name}...', file=sys.stderr)
+        results['endpoints'][name] = run_endpoint(client, name, concurrency_levels, args.requests, args.warmup, args.seed)
+    if not args.no_micro:
+        results['micro'] = run_micro(args.micro_repeat, args.seed)
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':<24}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'shed':>8}{'errors':>8}")
+    for name, levels in results['endpoints'].items():
+        if 'skipped' in levels:
+            print(f"{name:<24}  skipped ({levels['skipped'][:60]})")
+            continue
+        for concurrency, stats in levels.items():
+            latency = stats['latencyMs'] or dict.fromkeys(LATENCY_KEYS, '-')
+            print(f"{name:<24}{concurrency:>6}{stats['throughput']:>10}{latency['p50']:>10}{latency['p95']:>10}"
+                  f"{latency['p99']:>10}{stats.get('shed', 0):>8}{stats['errors']:>8}")
+    for name, stats in results.get('micro', {}).items():
+        latency = stats['latencyUs']
+        print(f"{name:<36}p50 {latency['p50']:>10} us   p99 {latency['p99']:>10} us")
+
+
+# Compare two result files. A latency percentile that grew, or a throughput that fell,
+# by more than threshold (a fraction) counts as a regression.
+def compare(baseline, candidate, threshold):
+    regressions = []
+    rows = []
+    for name, levels in candidate['endpoints'].items():
+        base_levels = baseline['endpoints'].get(name, {})
+        if 'skipped' in levels or 'skipped' in base_levels:
+            continue
+        for concurrency, stats in levels.items():
+            base = base_levels.get(concurrency)
+            if base is None:
+                continue
+            if base['latencyMs'] and stats['latencyMs']:
+                for key in LATENCY_KEYS:
+                    rows.append((f'{name} @ {concurrency} {key} ms', base['latencyMs'][key], stats['latencyMs'][key], False))
+            rows.append((f'{name} @ {concurrency} req/s', base['throughput'], stats['throughput'], True))
+    for name, stats in candidate.get('micro', {}).items():
+        base = baseline.get('micro', {}).get(name)
+        if base is not None:
+            rows.append((f'{name} p50 us', base['latencyUs']['p50'], stats['latencyUs']['p50'], False))
+
+    for label, old, new, higher_is_better in rows:
+        change = (new - old) / old if old else 0.0
+        regressed = change < -threshold if higher_is_better else change > threshold
+        if regressed:
+            regressions.append(label)
+        print(f"{label:<48}{old:>12}{new:>12}{change:>+10.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test and micro-benchmark the sustinia-ai endpoints')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='benchmark a service and write the results as JSON')
+    run_parser.add_argument('--service', choices=sorted(SERVICE_ENDPOINTS), default='ml')
+    run_parser.add_argument('--mode', choices=['stub', 'real'], default='stub',
+                            help='stub models (offline, measures the service) or the real model artifacts')
+    run_parser.add_argument('--url', help='benchmark a running service over HTTP instead of in-process')
+    run_parser.add_argument('--endpoints', help=f'comma-separated subset of: {", ".join(ENDPOINTS)}')
+    run_parser.add_argument('--concurrency', default='1,4,16', help='comma-separated concurrency levels')
+    run_parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and concurrency level')
+    run_parser.add_argument('--warmup', type=int, default=5)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--micro-repeat', type=int, default=200)
+    run_parser.add_argument('--no-micro', action='store_true', help='skip the in-process micro-benchmarks')
+    run_parser.add_argument('--log-level', default='WARNING', help='service log level during the run')
+    run_parser.add_argument('--output', help='write the results to this JSON file')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files and flag regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='relative change counted as a regression (default 0.10)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.threshold)
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}')
+        return 1 if regressions else 0
+
+    # The service is loaded from its own directory, so resolve the output path first
+    output = os.path.abspath(args.output) if args.output else None
+    results = run(args)
+    print_results(results)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# Exclusive lock on <path>.lock, serializing writers of one file across worker processes
+class FileLock:
+    def __init__(self, path):
+        self.path = f'{path}.lock'
+
+    def __enter__(self):
+        import fcntl
+        self.file = open(self.path, 'w')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        import fcntl
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+# Thread-safe, size-bounded LRU mapping with hit/miss counters
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Snapshot of (key, value) pairs, least recently used first
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+
+# Caches /analyze results keyed by the SHA-256 of the uploaded bytes and the model version.
+# Lookups go to the in-memory LRU first and then, if disk_dir is set, to a JSON
+# file per image so results survive restarts and are shared between workers.
+class ImageResultCache:
+    def __init__(self, maxsize=1024, disk_dir=None):
+        self.memory = LRUCache(maxsize)
+        self.disk_dir = disk_dir
+        self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # Results depend on the model, so the model version is part of the key
+    @staticmethod
+    def key(data, version=None):
+        digest = hashlib.sha256(data)
+        if version:
+            digest.update(f'\0{version}'.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        results = self.memory.get(key)
+        if results is not None or not self.disk_dir:
+            return results
+        try:
+            with open(self._disk_path(key)) as f:
+                results = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read cached image result {key}: {e}")
+            return None
+        self.disk_hits += 1
+        self.memory.put(key, results)
+        return results
+
+    def put(self, key, results):
+        self.memory.put(key, results)
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see a partial entry
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(results, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write cached image result {key}: {e}")
+
+    def stats(self):
+        stats = self.memory.stats()
+        # Disk hits are memory misses that still avoided inference
+        stats['misses'] -= self.disk_hits
+        stats['diskHits'] = self.disk_hits
+        stats['diskDir'] = self.disk_dir
+        return stats
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+
+# Comments that differ only in case or spacing share one sentiment result
+def normalize_comment(comment):
+    return ' '.join(comment.split()).casefold()
+
+
+# Memoizes sentiment pipeline results keyed by normalized comment text.
+# With a path set, entries are loaded at startup and written back every
+# save_every new entries (and on save()), so repeat comments stay cheap across restarts.
+class SentimentMemo:
+    def __init__(self, maxsize=10000, path=None, save_every=500):
+        self.cache = LRUCache(maxsize)
+        self.path = path
+        self.save_every = save_every
+        self._unsaved = 0
+        self._cleared = False
+        self._save_lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, comment):
+        return self.cache.get(normalize_comment(comment))
+
+    def put(self, comment, result):
+        self.cache.put(normalize_comment(comment), {'label': result['label'], 'score': float(result['score'])})
+        if self.path:
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self.save()
+
+    # Forget every result, e.g. after the sentiment model was replaced
+    def clear(self):
+        self.cache.clear()
+        self._cleared = True
+        self._unsaved += 1
+        self.save()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load sentiment memo from {self.path}: {e}")
+            return []
+
+    def load(self):
+        for key, result in self._read():
+            self.cache.put(key, result)
+        logger.info(f"Loaded {len(self.cache)} memoized sentiment results")
+
+    # Workers share the file: results other workers saved are kept (as older than this
+    # process's) unless the memo was cleared since the last save. Nothing is written when
+    # nothing changed.
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            if not self._unsaved:
+                return
+            self._unsaved = 0
+            try:
+                with FileLock(self.path):
+                    # Least recently used first, so reloading preserves the eviction order
+                    merged = LRUCache(self.cache.maxsize)
+                    if not self._cleared:
+                        for key, result in self._read():
+                            merged.put(key, result)
+                    for key, result in self.cache.items():
+                        merged.put(key, result)
+                    tmp_path = f'{self.path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'w') as f:
+                        json.dump(merged.items(), f)
+                    os.replace(tmp_path, self.path)
+                self._cleared = False
+            except OSError as e:
+                logger.error(f"Failed to save sentiment memo to {self.path}: {e}")
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['path'] = self.path
+        return stats
@@ -0,0 +1,101 @@
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+CATEGORICAL_COLUMNS = [
+    'Type of Food', 'Event Type', 'Storage Conditions',
+    'Purchase History', 'Seasonality', 'Preparation Method',
+    'Geographical Location', 'Pricing'
+]
+
+# Inputs that must be numeric even when they are not model features
+NUMERICAL_COLUMNS = ['Number of Guests', 'Quantity of Food']
+
+
+# Turns raw event records into scaled model inputs without going through pandas.
+# Built once from feature_columns.pkl and scaler.pkl: each "<column>_<value>" dummy
+# column becomes a (column, value) -> index lookup, and each numeric feature keeps its
+# index. Categories missing from feature_columns (the dropped first level, or values
+# never seen in training) leave every dummy for that column at zero, as the one-hot
+# encoding used in training does.
+class FeatureEncoder:
+    def __init__(self, feature_columns, scaler, categorical_columns=CATEGORICAL_COLUMNS):
+        self.feature_columns = list(feature_columns)
+        self.scaler = scaler
+        self.categorical_columns = list(categorical_columns)
+        self.category_index = {}
+        self.numeric_index = {}
+        for index, name in enumerate(self.feature_columns):
+            for column in self.categorical_columns:
+                prefix = f'{column}_'
+                if name.startswith(prefix):
+                    self.category_index[(column, name[len(prefix):])] = index
+                    break
+            else:
+                self.numeric_index[name] = index
+        self.numerical_columns = list(self.numeric_index) + [
+            column for column in NUMERICAL_COLUMNS if column not in self.numeric_index
+        ]
+
+        # Standard scaling runs as in-place vector ops on the feature matrix;
+        # any other scaler falls back to its own transform
+        self.mean = None
+        self.scale = None
+        if isinstance(scaler, StandardScaler):
+            if scaler.with_mean:
+                self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+            if scaler.with_std:
+                self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+    def transform(self, records):
+        features = np.zeros((len(records), len(self.feature_columns)), dtype=np.float64)
+        for row, record in enumerate(records):
+            self._encode(record, features[row])
+        return self._scale(features)
+
+    def transform_one(self, record):
+        return self.transform([record])
+
+    # Like transform, but an invalid record is reported in errors instead of failing
+    # the batch. Returns the scaled rows of the valid records and one error (or None)
+    # per input record.
+    def transform_partial(self, records):
+        features = np.zeros((len(records), len(self.feature_columns)), dtype=np.float64)
+        errors = [None] * len(records)
+        for row, record in enumerate(records):
+            try:
+                self._encode(record, features[row])
+            except ValueError as e:
+                errors[row] = str(e)
+        valid = [row for row, error in enumerate(errors) if error is None]
+        return self._scale(features[valid]), errors
+
+    def _encode(self, record, out):
+        for column in self.numerical_columns:
+            if column not in record:
+                if column in self.numeric_index:
+                    raise ValueError(f"Missing numerical input: {column}")
+                continue
+            try:
+                value = float(record[column])
+            except (TypeError, ValueError):
+                raise ValueError("Invalid numerical inputs")
+            if np.isnan(value):
+                raise ValueError("Invalid numerical inputs")
+            if column in self.numeric_index:
+                out[self.numeric_index[column]] = value
+        for column in self.categorical_columns:
+            value = record.get(column)
+            if value is None:
+                continue
+            index = self.category_index.get((column, str(value)))
+            if index is not None:
+                out[index] = 1.0
+
+    def _scale(self, features):
+        if not isinstance(self.scaler, StandardScaler):
+            return self.scaler.transform(features)
+        if self.mean is not None:
+            features -= self.mean
+        if self.scale is not None:
+            features /= self.scale
+        return features
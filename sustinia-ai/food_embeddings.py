@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import glob
+import random
+import argparse
+import threading
+import logging
+
+import numpy as np
+
+from caching import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Food-101 class names by head output index
+CLASS_INDICES_PATH = 'class_indices.json'
+
+# Softmax head over MobileNetV2 embeddings (kernel: embedding size x classes, bias: classes),
+# written by `python food_embeddings.py train-head <Food-101 images dir>`
+FOOD_HEAD_PATH = os.environ.get('FOOD_HEAD_PATH', 'food101_head.npz')
+
+# Donation photo embeddings, saved as <path>.npy (float16, memory-mapped on load) and
+# <path>.json (item ids and labels)
+FOOD_INDEX_PATH = os.environ.get('FOOD_INDEX_PATH', 'food_index')
+
+# Cosine similarity from which two photos are reported as near-duplicates
+DUPLICATE_THRESHOLD = float(os.environ.get('FOOD_DUPLICATE_THRESHOLD', 0.95))
+
+# Largest number of similar items returned by one lookup
+MAX_SIMILAR = 50
+
+# Rows of the stored matrix converted to float32 at a time while scoring
+SEARCH_CHUNK_ROWS = 65536
+
+
+def load_class_names(path=CLASS_INDICES_PATH):
+    with open(path) as f:
+        indices = json.load(f)
+    names = [None] * len(indices)
+    for name, index in indices.items():
+        if not 0 <= index < len(names):
+            raise ValueError(f'{path}: index {index} of "{name}" is out of range')
+        names[index] = name
+    if None in names:
+        raise ValueError(f'{path} does not map every index from 0 to {len(names) - 1}')
+    return names
+
+
+# Dense softmax layer over image embeddings, evaluated with NumPy. The kernel can be
+# kept as float16 to halve its memory; scores are still computed in float32.
+class FoodHead:
+    def __init__(self, kernel, bias, class_names, dtype=np.float32):
+        kernel = np.asarray(kernel, dtype=dtype)
+        bias = np.asarray(bias, dtype=np.float32)
+        if kernel.ndim != 2 or kernel.shape[1] != len(class_names) or bias.shape != (len(class_names),):
+            raise ValueError(f'Head shapes {kernel.shape} / {bias.shape} do not match {len(class_names)} classes')
+        self.kernel = kernel
+        self.bias = bias
+        self.class_names = class_names
+
+    @classmethod
+    def load(cls, path=FOOD_HEAD_PATH, class_indices_path=CLASS_INDICES_PATH, dtype=np.float32):
+        with np.load(path) as data:
+            return cls(data['kernel'], data['bias'], load_class_names(class_indices_path), dtype)
+
+    def save(self, path=FOOD_HEAD_PATH):
+        with open(path, 'wb') as f:
+            np.savez(f, kernel=self.kernel, bias=self.bias)
+
+    @property
+    def embedding_size(self):
+        return self.kernel.shape[0]
+
+    def predict(self, embeddings):
+        logits = np.asarray(embeddings, dtype=np.float32) @ self.kernel.astype(np.float32, copy=False) + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        scores = np.exp(logits)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def top(self, embedding, k=3):
+        scores = self.predict(np.asarray(embedding)[None])[0]
+        best = np.argsort(scores)[::-1][:k]
+        return [{'label': self.class_names[i], 'confidence': float(scores[i])} for i in best]
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Nearest-neighbour index of L2-normalized image embeddings, searched by cosine similarity
+# with a brute-force matrix product. Saved rows stay in the memory-mapped .npy file and
+# rows added since the last save are kept in memory until the next save, which happens
+# every save_every changes (and on save()). Worker processes share the file: a save
+# merges this process's changes, by id, into the file's current contents under a file
+# lock, and picks up the rows other workers saved.
+class EmbeddingIndex:
+    def __init__(self, path=None, save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self.dim = None
+        self._saved = None
+        self._added = []
+        self._added_matrix = None
+        self.ids = []
+        self.labels = []
+        self._rows = {}
+        self._removed = set()
+        # Changes not saved yet: item id -> (float16 embedding, label), or None if removed
+        self._pending = {}
+        self._unsaved = 0
+        self._lock = threading.RLock()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    @property
+    def _saved_count(self):
+        return 0 if self._saved is None else len(self._saved)
+
+    def _added_rows(self):
+        if self._added_matrix is None and self._added:
+            self._added_matrix = np.stack(self._added)
+        return self._added_matrix
+
+    def add(self, item_id, embedding, label=None):
+        vector = _normalize(embedding)
+        with self._lock:
+            if self.dim is None:
+                self.dim = len(vector)
+            elif len(vector) != self.dim:
+                raise ValueError(f'Expected a {self.dim}-dimensional embedding, got {len(vector)}')
+            self._pending[item_id] = (vector.astype(np.float16), label)
+            self._add_row(item_id, *self._pending[item_id])
+            self._changed()
+
+    def remove(self, item_id):
+        with self._lock:
+            if not self._remove_row(item_id):
+                return False
+            self._pending[item_id] = None
+            self._changed()
+            return True
+
+    def _add_row(self, item_id, vector, label):
+        # Adding an id again replaces its embedding
+        self._remove_row(item_id)
+        self._rows[item_id] = len(self.ids)
+        self.ids.append(item_id)
+        self.labels.append(label)
+        self._added.append(vector)
+        self._added_matrix = None
+
+    def _remove_row(self, item_id):
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return False
+        self._removed.add(row)
+        return True
+
+    def _changed(self):
+        self._unsaved += 1
+        if self.path and self._unsaved >= self.save_every:
+            self.save()
+
+    # Stored (normalized) embedding of an item, or None
+    def embedding(self, item_id):
+        with self._lock:
+            row = self._rows.get(item_id)
+            if row is None:
+                return None
+            if row < self._saved_count:
+                return np.asarray(self._saved[row], dtype=np.float32)
+            return self._added[row - self._saved_count].astype(np.float32)
+
+    def _scores(self, query):
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, self._saved_count, SEARCH_CHUNK_ROWS):
+            chunk = self._saved[start:start + SEARCH_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        if self._added:
+            scores[self._saved_count:] = self._added_rows().astype(np.float32) @ query
+        if self._removed:
+            scores[list(self._removed)] = -np.inf
+        return scores
+
+    # The k most similar items as [{"id", "label", "similarity"}], best first
+    def search(self, embedding, k=5, exclude=None):
+        query = _normalize(embedding)
+        with self._lock:
+            if not self._rows:
+                return []
+            if len(query) != self.dim:
+                raise ValueError(f'Expected a {self.dim}-dimensional embedding, got {len(query)}')
+            scores = self._scores(query)
+            if exclude in self._rows:
+                scores[self._rows[exclude]] = -np.inf
+            k = min(k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [{'id': self.ids[row], 'label': self.labels[row], 'similarity': round(float(scores[row]), 4)}
+                    for row in best if np.isfinite(scores[row])]
+
+    # (memory-mapped embeddings, metadata) of the saved index, or None
+    def _read(self):
+        try:
+            with open(f'{self.path}.json') as f:
+                meta = json.load(f)
+            saved = np.load(f'{self.path}.npy', mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load food index from {self.path}: {e}")
+            return None
+        if saved.ndim != 2 or len(saved) != len(meta['ids']) or len(meta['labels']) != len(meta['ids']):
+            logger.error(f"Ignoring food index at {self.path}: {len(meta['ids'])} ids for {saved.shape} embeddings")
+            return None
+        return saved, meta
+
+    # Replace the rows with the saved ones, then re-apply the changes not saved yet
+    def _use(self, saved, meta):
+        self._saved = saved if len(saved) else None
+        # An index saved before any photo was added has no embedding size yet
+        self.dim = saved.shape[1] or None
+        self.ids = list(meta['ids'])
+        self.labels = list(meta['labels'])
+        self._rows = {item_id: row for row, item_id in enumerate(self.ids)}
+        self._added = []
+        self._added_matrix = None
+        self._removed = set()
+        for item_id, change in list(self._pending.items()):
+            if change is None:
+                self._remove_row(item_id)
+            elif self.dim not in (None, len(change[0])):
+                logger.error(f"Dropping unsaved food photo {item_id}: the saved index holds "
+                             f"{self.dim}-dimensional embeddings, not {len(change[0])}")
+                del self._pending[item_id]
+            else:
+                self.dim = len(change[0])
+                self._add_row(item_id, *change)
+
+    def load(self):
+        with self._lock:
+            data = self._read()
+            if data is None:
+                return
+            self._use(*data)
+        logger.info(f"Loaded {len(self._rows)} food photo embeddings from {self.path}.npy")
+
+    # Merge the changes since the last save into the index file and map the result in
+    # place of the in-memory rows. Nothing is written when nothing changed.
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._pending:
+                return
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with FileLock(self.path):
+                    # Start from the file as other workers left it
+                    data = self._read()
+                    if data is not None:
+                        self._use(*data)
+                    self._write()
+            except OSError as e:
+                logger.error(f"Failed to save food index to {self.path}: {e}")
+                return
+            self._pending = {}
+            self._unsaved = 0
+            data = self._read()
+            if data is not None:
+                self._use(*data)
+
+    def _write(self):
+        live = sorted(self._rows.values())
+        parts = [part for part in (self._saved, self._added_rows()) if part is not None]
+        if parts:
+            matrix = np.concatenate(parts)[live].astype(np.float16)
+        else:
+            matrix = np.empty((0, self.dim or 0), dtype=np.float16)
+        meta = {'ids': [self.ids[row] for row in live], 'labels': [self.labels[row] for row in live]}
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(f'{tmp_path}.npy', 'wb') as f:
+            np.save(f, matrix)
+        with open(f'{tmp_path}.json', 'w') as f:
+            json.dump(meta, f)
+        os.replace(f'{tmp_path}.npy', f'{self.path}.npy')
+        os.replace(f'{tmp_path}.json', f'{self.path}.json')
+
+    def stats(self):
+        return {'size': len(self._rows), 'mapped': self._saved_count, 'unsaved': self._unsaved,
+                'dim': self.dim, 'path': self.path}
+
+
+# MobileNetV2 without its ImageNet classifier: one 1280-value embedding per image
+def build_embedding_model():
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+    return MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
+
+
+# Fit the Food-101 head on MobileNetV2 embeddings of a Food-101 style image directory
+# (<dir>/<class name>/*.jpg), using per_class images of every class in class_indices.json
+def train_head(image_dir, per_class=100, seed=0, batch_size=64):
+    from sklearn.linear_model import LogisticRegression
+    from image_preprocessing import decode_image
+
+    class_names = load_class_names()
+    model = build_embedding_model()
+    rng = random.Random(seed)
+    embeddings, labels = [], []
+    for index, name in enumerate(class_names):
+        paths = sorted(glob.glob(os.path.join(image_dir, name, '*')))
+        if not paths:
+            raise ValueError(f'No images for class "{name}" in {image_dir}')
+        paths = rng.sample(paths, min(per_class, len(paths)))
+        for start in range(0, len(paths), batch_size):
+            batch = []
+            for path in paths[start:start + batch_size]:
+                with open(path, 'rb') as f:
+                    batch.append(decode_image(f.read()).copy())
+            embeddings.append(model.predict(np.stack(batch), verbose=0))
+            labels.extend([index] * len(batch))
+        logger.info(f"Embedded {len(paths)} images of {name} ({index + 1}/{len(class_names)})")
+
+    classifier = LogisticRegression(max_iter=1000, C=1.0)
+    classifier.fit(np.concatenate(embeddings), np.array(labels))
+    return FoodHead(classifier.coef_.T, classifier.intercept_, class_names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the Food-101 head for MobileNetV2 embeddings')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train-head', help='fit the head on a Food-101 style image directory')
+    train_parser.add_argument('image_dir')
+    train_parser.add_argument('--per-class', type=int, default=100, help='images sampled per class')
+    train_parser.add_argument('--seed', type=int, default=0)
+    train_parser.add_argument('--output', default=FOOD_HEAD_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    image_dir = os.path.abspath(args.image_dir)
+    output = os.path.abspath(args.output)
+    # class_indices.json is relative to the service directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    head = train_head(image_dir, args.per_class, args.seed)
+    head.save(output)
+    print(f'Saved the Food-101 head ({head.embedding_size} x {len(head.class_names)}) to {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+FORECAST_COLUMNS = ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+
+# Horizon (in days) computed up front when a model is loaded
+DEFAULT_MAX_DAYS = int(os.environ.get('FORECAST_CACHE_MAX_DAYS', 365))
+
+# Longest horizon the forecast routes accept. By default it is the precomputed horizon,
+# so no request can make a worker run Prophet.
+MAX_FORECAST_DAYS = int(os.environ.get('MAX_FORECAST_DAYS', DEFAULT_MAX_DAYS))
+
+
+# Caches the future part of a Prophet forecast per model.
+# The forecast is computed once up to max_days and any shorter horizon is served
+# as a slice of it; longer horizons are computed on demand and replace the cached
+# forecast. Forecasts of the `keep` most recently cached models are kept, so requests
+# still running on a model that was just reloaded keep hitting the cache.
+class ForecastCache:
+    def __init__(self, name, max_days=DEFAULT_MAX_DAYS, keep=2):
+        self.name = name
+        self.max_days = max_days
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def warm(self, model):
+        if model is None:
+            return
+        try:
+            self.get(model, self.max_days)
+            logger.info(f"Cached {self.name} forecast for {self.max_days} days")
+        except Exception as e:
+            logger.error(f"Failed to precompute {self.name} forecast: {e}")
+
+    # Compute the forecast of a model that is not serving yet, without caching it;
+    # raises if the model cannot forecast
+    def prepare(self, model):
+        return self._compute(model, self.max_days)
+
+    # Cache a forecast computed by prepare()
+    def install(self, model, forecast):
+        with self._lock:
+            self._store(model, forecast)
+        logger.info(f"Cached {self.name} forecast for {len(forecast)} days")
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, model, days):
+        forecast = self._cached(model)
+        if forecast is None or len(forecast) < days:
+            with self._lock:
+                forecast = self._lookup(model)
+                if forecast is None or len(forecast) < days:
+                    forecast = self._compute(model, max(days, self.max_days))
+                    self._store(model, forecast)
+        return forecast.head(days).copy()
+
+    def _cached(self, model):
+        with self._lock:
+            return self._lookup(model)
+
+    def _lookup(self, model):
+        entry = self._entries.get(id(model))
+        # The id of a collected model can be reused, so check the object too
+        if entry is None or entry[0] is not model:
+            return None
+        return entry[1]
+
+    def _store(self, model, forecast):
+        self._entries[id(model)] = (model, forecast)
+        self._entries.move_to_end(id(model))
+        while len(self._entries) > self.keep:
+            self._entries.popitem(last=False)
+
+    def _compute(self, model, days):
+        # Only the future dates are needed, so skip predicting over the history
+        future = model.make_future_dataframe(periods=days, include_history=False)
+        forecast = model.predict(future)
+        return forecast[FORECAST_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Supported ?freq= values and the pandas rule for each; periods are labelled by their
+# first day (weeks start on Monday)
+RESAMPLE_RULES = {'day': None, 'week': 'W-MON', 'month': 'MS'}
+
+# Gap responses cached per model versions, horizon and frequency
+GAP_CACHE_SIZE = int(os.environ.get('FORECAST_GAP_CACHE_SIZE', 64))
+
+SERIES = ['donations', 'requests']
+
+
+# Put both forecasts side by side on the dates they share
+def _combine(donations, requests):
+    frame = pd.DataFrame({'ds': donations['ds'].to_numpy()})
+    for name, forecast in (('donations', donations), ('requests', requests)):
+        values = forecast.set_index('ds').reindex(frame['ds'])
+        frame[name] = values['yhat'].to_numpy()
+        frame[f'{name}_lower'] = values['yhat_lower'].to_numpy()
+        frame[f'{name}_upper'] = values['yhat_upper'].to_numpy()
+    return frame.dropna().reset_index(drop=True)
+
+
+# Donations, requests and their gap (donations - requests) per day, week or month.
+# Resampled values are totals over the period, with `days` giving how many forecast days
+# it covers (the first and last periods can be partial). Prophet bounds are quantiles
+# and do not add up exactly, so the summed bounds are the conservative band for fully
+# correlated daily errors. The gap band pairs the extreme bounds the same way:
+# gap_lower = donations_lower - requests_upper, gap_upper = donations_upper - requests_lower.
+def forecast_gap(donations, requests, freq='day'):
+    frame = _combine(donations, requests)
+    rule = RESAMPLE_RULES[freq]
+    if rule is None:
+        frame['days'] = 1
+    else:
+        grouped = frame.set_index('ds').resample(rule, label='left', closed='left')
+        days = grouped.size()
+        frame = grouped.sum()
+        frame['days'] = days
+        frame = frame[frame['days'] > 0].reset_index()
+
+    frame['gap'] = frame['donations'] - frame['requests']
+    frame['gap_lower'] = frame['donations_lower'] - frame['requests_upper']
+    frame['gap_upper'] = frame['donations_upper'] - frame['requests_lower']
+
+    value_columns = [f'{name}{suffix}' for name in SERIES + ['gap'] for suffix in ('', '_lower', '_upper')]
+    frame[value_columns] = np.round(frame[value_columns].to_numpy(dtype=np.float64), 2)
+    frame['days'] = frame['days'].astype(int)
+    frame['ds'] = frame['ds'].dt.strftime('%Y-%m-%d')
+    return frame[['ds', 'days'] + value_columns]
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+import logging
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from caching import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Forecast series that can be refitted: the registry model serving it and its pickle
+SERIES = {
+    'donations': {'model': 'donation_forecast', 'path': 'donation_forecast_model2.pkl'},
+    'requests': {'model': 'request_forecast', 'path': 'request_forecast_model2.pkl'},
+}
+
+# Ingested daily counts, one CSV (ds,y) per series, shared by every worker
+DATA_DIR = os.environ.get('FORECAST_DATA_DIR', 'forecast_data')
+
+# Largest number of daily rows accepted by one ingest call
+MAX_INGEST_ROWS = int(os.environ.get('FORECAST_MAX_INGEST_ROWS', 10000))
+
+# Horizon of the forecast checked before a refitted model is published
+CHECK_DAYS = 30
+
+# Seconds a background fit may run before its process is killed
+FIT_TIMEOUT = float(os.environ.get('FORECAST_FIT_TIMEOUT', 1800))
+
+
+def data_path(series, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'{series}_daily.csv')
+
+
+# Validate [{"ds": "YYYY-MM-DD", "y": count}, ...] into a (ds, y) frame; raises ValueError
+def parse_observations(rows):
+    if not isinstance(rows, list) or not rows:
+        raise ValueError('Observations must be a non-empty list of {"ds": "YYYY-MM-DD", "y": number} objects')
+    if len(rows) > MAX_INGEST_ROWS:
+        raise ValueError(f'At most {MAX_INGEST_ROWS} observations can be ingested at once')
+    if not all(isinstance(row, dict) and 'ds' in row and 'y' in row for row in rows):
+        raise ValueError('Each observation must be an object with "ds" and "y"')
+    try:
+        ds = pd.to_datetime([row['ds'] for row in rows], format='%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError('Observation dates must be YYYY-MM-DD strings')
+    try:
+        y = pd.to_numeric([row['y'] for row in rows]).astype(float)
+    except (TypeError, ValueError):
+        raise ValueError('Observation counts must be non-negative numbers')
+    frame = pd.DataFrame({'ds': ds, 'y': y})
+    if not np.isfinite(frame['y']).all() or (frame['y'] < 0).any():
+        raise ValueError('Observation counts must be non-negative numbers')
+    if frame['ds'].max().date() > date.today():
+        raise ValueError('Observations cannot be in the future')
+    return frame
+
+
+def load_observations(path):
+    if not os.path.exists(path):
+        return pd.DataFrame({'ds': pd.Series(dtype='datetime64[ns]'), 'y': pd.Series(dtype=float)})
+    return pd.read_csv(path, parse_dates=['ds'])
+
+
+# Later rows win when a day appears twice, so corrections can be re-sent
+def merge_observations(existing, new):
+    merged = pd.concat([existing, new], ignore_index=True)
+    merged = merged.drop_duplicates('ds', keep='last').sort_values('ds')
+    return merged.reset_index(drop=True)
+
+
+# Append observations to a series' data file; returns the number of stored days
+def ingest(series, observations, data_dir=DATA_DIR):
+    path = data_path(series, data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    with FileLock(path):
+        merged = merge_observations(load_observations(path), observations)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        merged.to_csv(tmp_path, index=False, date_format='%Y-%m-%d')
+        os.replace(tmp_path, path)
+    return len(merged)
+
+
+# The model's own training history with the ingested days laid over it. Extra history
+# columns (cap, floor, regressors) are carried forward from the last known value.
+def training_data(model, observations):
+    history = model.history.drop(columns=['t', 'y_scaled', 'cap_scaled'], errors='ignore')
+    extra_columns = [column for column in history.columns if column not in ('ds', 'y')]
+    merged = merge_observations(history, observations)
+    if extra_columns:
+        merged[extra_columns] = merged[extra_columns].ffill()
+    return merged
+
+
+# Fitted parameters of a MAP (or MCMC) Prophet fit, in the form fit(init=...) expects
+def warm_start_params(model):
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        params[name] = model.params[name][0][0] if model.mcmc_samples == 0 else np.mean(model.params[name])
+    for name in ['delta', 'beta']:
+        params[name] = model.params[name][0] if model.mcmc_samples == 0 else np.mean(model.params[name], axis=0)
+    return params
+
+
+# Refit a Prophet model on its history plus the ingested data, warm-started from its
+# fitted parameters. Writes the new model to output_path and returns fit statistics.
+def fit_model(model_path, observations_path, output_path):
+    from prophet.diagnostics import prophet_copy
+
+    model = joblib.load(model_path)
+    history = training_data(model, load_observations(observations_path))
+
+    start = time.perf_counter()
+    warm_start = True
+    try:
+        refitted = prophet_copy(model).fit(history, init=warm_start_params(model))
+    except Exception as e:
+        logger.warning(f"Warm-started fit failed, fitting from scratch: {e}")
+        warm_start = False
+        refitted = prophet_copy(model).fit(history)
+    fit_seconds = time.perf_counter() - start
+
+    # Refuse to publish a model that cannot forecast
+    forecast = refitted.predict(refitted.make_future_dataframe(periods=CHECK_DAYS, include_history=False))
+    if not np.isfinite(forecast['yhat'].to_numpy(dtype=np.float64)).all():
+        raise ValueError('Refitted model produced non-finite forecasts')
+
+    joblib.dump(refitted, output_path)
+    return {
+        'fitSeconds': round(fit_seconds, 3),
+        'warmStart': warm_start,
+        'rows': len(history),
+        'lastObservation': history['ds'].max().strftime('%Y-%m-%d'),
+    }
+
+
+# Run fit_model in a fresh interpreter through this module's `fit` command. Forking a
+# service process that holds TensorFlow or PyTorch state is unsafe, and a spawned pool
+# would re-import the service script (warm-up, watcher and exit hooks included); the
+# command only imports this module and Prophet.
+def fit_model_in_subprocess(model_path, observations_path, output_path, timeout=FIT_TIMEOUT):
+    command = [sys.executable, os.path.abspath(__file__), 'fit',
+               os.path.abspath(model_path), os.path.abspath(observations_path), os.path.abspath(output_path)]
+    completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        raise RuntimeError(f"Fit process exited with code {completed.returncode}: {lines[-1] if lines else 'no output'}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# Replace the served pickle in one rename, keeping the previous model next to it as .prev
+def publish(output_path, model_path):
+    if os.path.exists(model_path):
+        shutil.copy2(model_path, f'{model_path}.prev')
+    os.replace(output_path, model_path)
+
+
+def restore_previous(model_path):
+    if os.path.exists(f'{model_path}.prev'):
+        shutil.copy2(f'{model_path}.prev', model_path)
+
+
+# Fit and publish one series. Refits of a series are serialized across processes (every
+# worker of both services can start one) by a lock on the model pickle, held from reading
+# the data to publishing, so the last model published was fitted on the newest data.
+# verify(result), if given, runs under the same lock after publishing and may undo it.
+def refit_series(series, data_dir=DATA_DIR, in_subprocess=False, verify=None):
+    config = SERIES[series]
+    output_path = f"{config['path']}.{os.getpid()}.refit.tmp"
+    fit = fit_model_in_subprocess if in_subprocess else fit_model
+    with FileLock(config['path']):
+        try:
+            result = fit(config['path'], data_path(series, data_dir), output_path)
+        except BaseException:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        publish(output_path, config['path'])
+        if verify is not None:
+            verify(result)
+    return result
+
+
+# Runs refits in a background process for a service and tracks their outcome.
+# Publishing replaces the pickle on disk; this process swaps the new model in through
+# the registry right away and other workers pick it up with their file watcher.
+class RefitManager:
+    def __init__(self, registry, data_dir=DATA_DIR):
+        self.registry = registry
+        self.data_dir = data_dir
+        self.jobs = {series: {'running': False, 'rerun': False, 'lastFit': None, 'lastError': None} for series in SERIES}
+        self._lock = threading.Lock()
+
+    def ingest(self, series, observations):
+        return ingest(series, observations, self.data_dir)
+
+    # Start a refit, or mark one to run again when it finishes so no ingested data is missed
+    def schedule(self, series):
+        with self._lock:
+            job = self.jobs[series]
+            if job['running']:
+                job['rerun'] = True
+                return 'queued'
+            job['running'] = True
+        threading.Thread(target=self._run, args=(series,), name=f'refit-{series}', daemon=True).start()
+        return 'started'
+
+    def _run(self, series):
+        from metrics import FORECAST_FIT_SECONDS, FORECAST_LAST_OBSERVATION
+        while True:
+            job = self.jobs[series]
+            started = time.time()
+            try:
+                result = refit_series(series, self.data_dir, in_subprocess=True,
+                                      verify=lambda result: self._swap(series, result))
+                result.update(startedAt=started, totalSeconds=round(time.time() - started, 3))
+                job['lastFit'] = result
+                job['lastError'] = None
+                FORECAST_FIT_SECONDS.labels(series).set(result['fitSeconds'])
+                FORECAST_LAST_OBSERVATION.labels(series).set(pd.Timestamp(result['lastObservation']).timestamp())
+                logger.info(f"Refitted {series} forecast: {result}")
+            except Exception as e:
+                logger.error(f"Refit of {series} forecast failed: {e}")
+                job['lastError'] = str(e)
+            with self._lock:
+                if not job['rerun']:
+                    job['running'] = False
+                    return
+                job['rerun'] = False
+
+    # Swap the published model in, or put the previous pickle back if it is rejected. A
+    # model disabled in this process (ENABLED_MODELS) is published for the processes
+    # that serve it.
+    def _swap(self, series, result):
+        reload = self.registry.models[SERIES[series]['model']].reload()
+        if reload['status'] not in ('swapped', 'disabled'):
+            restore_previous(SERIES[series]['path'])
+            raise ValueError(f"Refitted model was rejected: {reload.get('error')}")
+        result['version'] = reload['version']
+
+    # Fit results and data freshness per series
+    def status(self):
+        status = {}
+        for series, config in SERIES.items():
+            model = self.registry.models[config['model']].value
+            history_end = model.history['ds'].max() if model is not None and getattr(model, 'history', None) is not None else None
+            observations = load_observations(data_path(series, self.data_dir))
+            ingested_end = observations['ds'].max() if len(observations) else None
+            job = self.jobs[series]
+            status[series] = {
+                'modelVersion': self.registry.models[config['model']].version,
+                'modelLastObservation': history_end.strftime('%Y-%m-%d') if history_end is not None else None,
+                'modelDataAgeDays': (pd.Timestamp(date.today()) - history_end).days if history_end is not None else None,
+                'ingestedDays': len(observations),
+                'ingestedLastObservation': ingested_end.strftime('%Y-%m-%d') if ingested_end is not None else None,
+                'running': job['running'],
+                'lastFit': job['lastFit'],
+                'lastError': job['lastError'],
+            }
+        return status
+
+
+# Register POST /forecast/ingest and GET /forecast/status on a Flask app
+def init_app(app, manager):
+    from flask import jsonify, request
+    from model_admin import authorized
+
+    def ingest_observations():
+        if not authorized():
+            return jsonify({'error': 'Not authorized'}), 403
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not any(series in data for series in SERIES):
+            return jsonify({'error': f'Expected observations for at least one of: {", ".join(SERIES)}'}), 400
+        try:
+            parsed = {series: parse_observations(data[series]) for series in SERIES if series in data}
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        stored = {series: manager.ingest(series, observations) for series, observations in parsed.items()}
+        refits = {}
+        if data.get('refit', True):
+            refits = {series: manager.schedule(series) for series in parsed}
+        return jsonify({'storedDays': stored, 'refit': refits}), 202
+
+    def forecast_status():
+        return jsonify(manager.status())
+
+    app.add_url_rule('/forecast/ingest', 'forecast_ingest', ingest_observations, methods=['POST'])
+    app.add_url_rule('/forecast/status', 'forecast_status', forecast_status, methods=['GET'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest daily counts and refit the Prophet forecast models')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help='add daily counts from a CSV with ds and y columns')
+    ingest_parser.add_argument('series', choices=sorted(SERIES))
+    ingest_parser.add_argument('csv')
+    ingest_parser.add_argument('--refit', action='store_true', help='refit the model after ingesting')
+    refit_parser = subparsers.add_parser('refit', help='refit models on their history plus the ingested data')
+    refit_parser.add_argument('series', nargs='*', choices=sorted(SERIES), help='defaults to every series')
+    # Used by running services for background refits; prints the fit statistics as JSON
+    fit_parser = subparsers.add_parser('fit', help='fit one model to a new file without publishing it')
+    fit_parser.add_argument('model_path')
+    fit_parser.add_argument('observations_path')
+    fit_parser.add_argument('output_path')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'fit':
+        print(json.dumps(fit_model(args.model_path, args.observations_path, args.output_path)))
+        return 0
+    csv_path = os.path.abspath(args.csv) if args.command == 'ingest' else None
+    # Model and data paths are relative to the service directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.command == 'ingest':
+        rows = pd.read_csv(csv_path, dtype={'ds': str}).to_dict(orient='records')
+        try:
+            stored = ingest(args.series, parse_observations(rows))
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f'{args.series}: {stored} days stored in {data_path(args.series)}')
+        series_list = [args.series] if args.refit else []
+    else:
+        series_list = args.series or sorted(SERIES)
+
+    # Running services load the published pickles with their file watcher
+    for series in series_list:
+        result = refit_series(series)
+        print(f'{series}: refitted and published {SERIES[series]["path"]} {result}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+TARGET_SIZE = (224, 224)
+
+# Uploads above these limits are rejected before any pixel data is decoded
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 40_000_000))
+
+_buffers = threading.local()
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+# Float32 input buffer reused by every request handled on the current thread
+def input_buffer(size=TARGET_SIZE):
+    buffer = getattr(_buffers, 'array', None)
+    if buffer is None or buffer.shape[:2] != (size[1], size[0]):
+        buffer = np.empty((size[1], size[0], 3), dtype=np.float32)
+        _buffers.array = buffer
+    return buffer
+
+
+# Decode an uploaded image into a MobileNetV2 input (pixels scaled to [-1, 1]).
+# Only the header is read before the size checks. JPEGs are then decoded at a reduced
+# resolution (draft mode) close to the target size, and other formats are shrunk with
+# a fast integer reduction before the final resize. The result is written into out
+# (the thread's reusable buffer by default); callers must finish with it before the
+# next decode on the same thread.
+def decode_image(data, size=TARGET_SIZE, out=None):
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f'Image is larger than {MAX_IMAGE_BYTES} bytes')
+
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f'Image has {width * height} pixels; the limit is {MAX_IMAGE_PIXELS}')
+
+    img.draft('RGB', size)
+    img = img.convert('RGB')
+    if img.size != size:
+        img = img.resize(size, Image.BICUBIC, reducing_gap=3.0)
+
+    out = input_buffer(size) if out is None else out
+    np.copyto(out, np.asarray(img), casting='unsafe')
+    out /= 127.5
+    out -= 1.0
+    return out
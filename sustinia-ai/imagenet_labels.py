@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import argparse
+import urllib.request
+
+import numpy as np
+
+# ImageNet class index of the MobileNetV2 classifier, in the Keras format
+# ({"0": ["n01440764", "tench"], ...}). With the file next to the models /analyze needs
+# neither TensorFlow's decode_predictions nor a download; fetch it once with
+# `python imagenet_labels.py export`. Without it, the index is downloaded into the Keras
+# cache like the MobileNetV2 weights (this needs TensorFlow).
+IMAGENET_CLASS_INDEX_PATH = os.environ.get('IMAGENET_CLASS_INDEX_PATH', 'imagenet_class_index.json')
+
+IMAGENET_CLASS_INDEX_URL = 'https://storage.googleapis.com/download.tensorflow.org/data/imagenet_class_index.json'
+
+IMAGENET_CLASSES = 1000
+
+
+def parse_class_index(index, source=IMAGENET_CLASS_INDEX_PATH):
+    if len(index) != IMAGENET_CLASSES:
+        raise ValueError(f'{source} has {len(index)} classes, expected {IMAGENET_CLASSES}')
+    labels = [None] * IMAGENET_CLASSES
+    for key, entry in index.items():
+        position = int(key)
+        if not 0 <= position < IMAGENET_CLASSES or len(entry) != 2:
+            raise ValueError(f'{source}: invalid entry {key}: {entry}')
+        labels[position] = entry[1]
+    if None in labels:
+        raise ValueError(f'{source} does not name every class from 0 to {IMAGENET_CLASSES - 1}')
+    return labels
+
+
+# Class descriptions by score index
+def load_imagenet_labels(path=IMAGENET_CLASS_INDEX_PATH):
+    if not os.path.exists(path):
+        from tensorflow.keras.utils import get_file
+        path = get_file('imagenet_class_index.json', IMAGENET_CLASS_INDEX_URL, cache_subdir='models')
+    with open(path) as f:
+        return parse_class_index(json.load(f), path)
+
+
+# The k best classes of one score vector as [(description, score)], best first
+def top_classes(scores, labels, k=3):
+    scores = np.asarray(scores).ravel()
+    best = np.argsort(scores)[::-1][:k]
+    return [(labels[i], float(scores[i])) for i in best]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch the ImageNet class index used by /analyze')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='download and check the Keras ImageNet class index')
+    export_parser.add_argument('--url', default=IMAGENET_CLASS_INDEX_URL)
+    export_parser.add_argument('--output', default=IMAGENET_CLASS_INDEX_PATH)
+    args = parser.parse_args(argv)
+
+    with urllib.request.urlopen(args.url, timeout=60) as response:
+        index = json.load(response)
+    parse_class_index(index, args.url)
+    with open(args.output, 'w') as f:
+        json.dump(index, f)
+    print(f'Saved {len(index)} ImageNet classes to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+import os
+import sys
+import glob
+import random
+import shutil
+import argparse
+import threading
+import logging
+
+import numpy as np
+
+from caching import FileLock
+from memory_budget import MEMORY_BUDGET
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Where exported TFLite / ONNX models are written and looked up
+EXPORT_DIR = os.environ.get('INFERENCE_EXPORT_DIR', os.path.join(BASE_DIR, 'optimized_models'))
+
+SENTIMENT_MODEL_NAME = 'distilbert-base-uncased-finetuned-sst-2-english'
+
+KERAS_BACKENDS = ['keras', 'tflite', 'onnx']
+SENTIMENT_BACKENDS = ['torch', 'onnx']
+QUANTIZATIONS = ['none', 'dynamic', 'int8', 'float16']
+
+
+# Backend and quantization for a model. INFERENCE_BACKEND / INFERENCE_QUANTIZATION set
+# the default, INFERENCE_BACKEND_<NAME> / INFERENCE_QUANTIZATION_<NAME> override it.
+# In memory-budget mode the defaults are float16 TFLite for Keras models and int8 ONNX
+# for the sentiment model.
+def backend_config(name):
+    default_backend, default_quantization = 'keras', 'none'
+    if MEMORY_BUDGET:
+        default_backend, default_quantization = ('onnx', 'dynamic') if name == 'sentiment' else ('tflite', 'float16')
+    backend = os.environ.get(f'INFERENCE_BACKEND_{name.upper()}')
+    if backend is None:
+        backend = os.environ.get('INFERENCE_BACKEND', default_backend)
+        # The sentiment model has no TFLite variant, so only a global "onnx" moves it off PyTorch
+        if name == 'sentiment':
+            backend = 'onnx' if backend.lower() == 'onnx' else 'torch'
+    backend = backend.lower()
+    quantization = os.environ.get(
+        f'INFERENCE_QUANTIZATION_{name.upper()}', os.environ.get('INFERENCE_QUANTIZATION', default_quantization)
+    ).lower()
+    # Float16 exports exist for the Keras models only; the sentiment model is quantized to int8 instead
+    if name == 'sentiment' and quantization == 'float16':
+        quantization = 'dynamic'
+    # ONNX Runtime quantization is dynamic: int8 weights, activations quantized at run time
+    if backend == 'onnx' and quantization == 'int8':
+        quantization = 'dynamic'
+    allowed = SENTIMENT_BACKENDS if name == 'sentiment' else KERAS_BACKENDS
+    if backend not in allowed:
+        raise ValueError(f'Unknown inference backend for {name}: "{backend}". Expected one of: {", ".join(allowed)}')
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f'Unknown quantization: "{quantization}". Expected one of: {", ".join(QUANTIZATIONS)}')
+    return backend, quantization
+
+
+def export_path(name, backend, quantization):
+    suffix = '' if quantization == 'none' else f'-{quantization}'
+    if name == 'sentiment':
+        return os.path.join(EXPORT_DIR, f'sentiment-{backend}{suffix}')
+    extension = 'tflite' if backend == 'tflite' else 'onnx'
+    return os.path.join(EXPORT_DIR, f'{name}{suffix}.{extension}')
+
+
+# TFLite interpreter with a Keras-style predict(); int8 inputs and outputs are
+# quantized and dequantized here so callers always see float32 arrays
+class TFLiteModel:
+    def __init__(self, path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        threads = num_threads or int(os.environ.get('TFLITE_NUM_THREADS', 0)) or None
+        self.path = path
+        self.interpreter = Interpreter(model_path=path, num_threads=threads)
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter holds mutable tensors and must not be invoked concurrently
+        self._lock = threading.Lock()
+
+    def predict(self, inputs, verbose=0, batch_size=None):
+        inputs = np.asarray(inputs, dtype=np.float32)
+        with self._lock:
+            if self._batch_size != len(inputs):
+                shape = [len(inputs)] + list(self.input_detail['shape'][1:])
+                self.interpreter.resize_tensor_input(self.input_detail['index'], shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(inputs)
+            self.interpreter.set_tensor(self.input_detail['index'], self._quantize(inputs, self.input_detail))
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self.output_detail['index'])
+        return self._dequantize(outputs, self.output_detail)
+
+    @staticmethod
+    def _quantize(values, detail):
+        if detail['dtype'] == np.float32:
+            return values
+        scale, zero_point = detail['quantization']
+        info = np.iinfo(detail['dtype'])
+        return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(detail['dtype'])
+
+    @staticmethod
+    def _dequantize(values, detail):
+        if detail['dtype'] == np.float32:
+            return values
+        scale, zero_point = detail['quantization']
+        return ((values.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+
+# ONNX Runtime session with a Keras-style predict()
+class OnnxModel:
+    def __init__(self, path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        threads = int(os.environ.get('ONNX_NUM_THREADS', 0))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, inputs, verbose=0, batch_size=None):
+        return self.session.run(None, {self.input_name: np.asarray(inputs, dtype=np.float32)})[0]
+
+
+# Exports are written under a temporary name and renamed into place, so a process that
+# finds the export path always sees a complete file (or directory)
+def _tmp_path(path):
+    return f'{path}.{os.getpid()}.tmp'
+
+
+def _publish_dir(tmp_dir, out_dir):
+    old_dir = f'{out_dir}.{os.getpid()}.old'
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def export_tflite(keras_model, path, quantization='none', representative_data=None):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization in ('dynamic', 'int8', 'float16'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        # Weights are stored as float16; inputs and outputs stay float32
+        converter.target_spec.supported_types = [tf.float16]
+    if quantization == 'int8':
+        if representative_data is None:
+            raise ValueError('int8 quantization needs representative data for calibration')
+        converter.representative_dataset = lambda: ([row[np.newaxis].astype(np.float32)] for row in representative_data)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(_tmp_path(path), 'wb') as f:
+        f.write(converter.convert())
+    os.replace(_tmp_path(path), path)
+    return path
+
+
+def export_onnx(keras_model, path, quantization='none'):
+    import tensorflow as tf
+    import tf2onnx
+    if quantization == 'int8':
+        raise ValueError('ONNX export of Keras models supports "none" or "dynamic" quantization')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    input_shape = (None,) + tuple(keras_model.inputs[0].shape[1:])
+    signature = (tf.TensorSpec(input_shape, tf.float32, name='input'),)
+    tmp_path = _tmp_path(path)
+    float_path = tmp_path if quantization == 'none' else f'{tmp_path}.float.onnx'
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, output_path=float_path)
+    if quantization == 'dynamic':
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(float_path, tmp_path, weight_type=QuantType.QInt8)
+        os.remove(float_path)
+    elif quantization == 'float16':
+        import onnx
+        from onnxconverter_common import float16
+        onnx.save(float16.convert_float_to_float16(onnx.load(float_path), keep_io_types=True), tmp_path)
+        os.remove(float_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def export_sentiment_onnx(out_dir, quantization='none', model_name=SENTIMENT_MODEL_NAME):
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+    if quantization == 'int8':
+        raise ValueError('The sentiment model supports "none" or "dynamic" quantization')
+    tmp_dir = _tmp_path(out_dir)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+    model.save_pretrained(tmp_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp_dir)
+    if quantization == 'dynamic':
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(tmp_dir, 'model.onnx'), os.path.join(tmp_dir, 'model_quantized.onnx'),
+                         weight_type=QuantType.QInt8)
+    _publish_dir(tmp_dir, out_dir)
+    return out_dir
+
+
+# Load a Keras model through the configured backend. build_keras returns the original
+# Keras model and is only called for the "keras" backend or when an export is missing.
+# Workers that start together export a missing model once: the others wait on the lock
+# and load the finished file.
+def load_keras_backend(name, build_keras, representative_data=None):
+    backend, quantization = backend_config(name)
+    if backend == 'keras':
+        return build_keras()
+    path = export_path(name, backend, quantization)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with FileLock(path):
+            if not os.path.exists(path):
+                logger.info(f"No {backend} export of {name} at {path}; exporting it now")
+                data = representative_data() if quantization == 'int8' and representative_data else None
+                if backend == 'tflite':
+                    export_tflite(build_keras(), path, quantization, data)
+                else:
+                    export_onnx(build_keras(), path, quantization)
+    logger.info(f"Serving {name} with {backend} backend ({quantization} quantization) from {path}")
+    return TFLiteModel(path) if backend == 'tflite' else OnnxModel(path)
+
+
+# Build the sentiment pipeline on the configured backend; the ONNX variant is a drop-in
+# replacement for the PyTorch pipeline (same call signature and output format)
+def load_sentiment_backend(model_name=SENTIMENT_MODEL_NAME):
+    from transformers import pipeline
+    backend, quantization = backend_config('sentiment')
+    if backend == 'torch':
+        return pipeline('sentiment-analysis', model=model_name)
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+    out_dir = export_path('sentiment', backend, quantization)
+    if not os.path.exists(out_dir):
+        os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+        with FileLock(out_dir):
+            if not os.path.exists(out_dir):
+                logger.info(f"No ONNX export of the sentiment model at {out_dir}; exporting it now")
+                export_sentiment_onnx(out_dir, quantization, model_name)
+    file_name = 'model_quantized.onnx' if quantization == 'dynamic' else 'model.onnx'
+    model = ORTModelForSequenceClassification.from_pretrained(out_dir, file_name=file_name)
+    logger.info(f"Serving sentiment with onnx backend ({quantization} quantization) from {out_dir}")
+    return pipeline('sentiment-analysis', model=model, tokenizer=AutoTokenizer.from_pretrained(out_dir))
+
+
+# Sample inputs used for int8 calibration and the parity check
+
+# Random event records covering every category the food models were trained on
+def sample_food_events(count, seed=0):
+    import joblib
+    from feature_encoder import CATEGORICAL_COLUMNS
+    feature_columns = joblib.load(os.path.join(BASE_DIR, 'feature_columns.pkl'))
+    levels = {column: ['Other'] for column in CATEGORICAL_COLUMNS}
+    for name in feature_columns:
+        for column in CATEGORICAL_COLUMNS:
+            if name.startswith(f'{column}_'):
+                levels[column].append(name[len(column) + 1:])
+    rng = random.Random(seed)
+    return [
+        dict({column: rng.choice(values) for column, values in levels.items()},
+             **{'Number of Guests': rng.randint(10, 500), 'Quantity of Food': rng.randint(20, 1000)})
+        for _ in range(count)
+    ]
+
+
+def sample_food_features(count, seed=0):
+    import joblib
+    from feature_encoder import FeatureEncoder
+    feature_columns = joblib.load(os.path.join(BASE_DIR, 'feature_columns.pkl'))
+    scaler = joblib.load(os.path.join(BASE_DIR, 'scaler.pkl'))
+    return FeatureEncoder(feature_columns, scaler).transform(sample_food_events(count, seed)).astype(np.float32)
+
+
+def sample_images(count, image_dir=None, seed=0):
+    from PIL import Image
+    image_dir = image_dir or os.path.join(BASE_DIR, '..', 'sustainafood-backend', 'uploads')
+    paths = sorted(glob.glob(os.path.join(image_dir, '*')))
+    random.Random(seed).shuffle(paths)
+    images = []
+    for path in paths:
+        if len(images) >= count:
+            break
+        try:
+            img = Image.open(path).convert('RGB').resize((224, 224))
+        except Exception:
+            continue
+        # MobileNetV2 preprocessing: scale pixels to [-1, 1]
+        images.append(np.asarray(img, dtype=np.float32) / 127.5 - 1.0)
+    rng = np.random.default_rng(seed)
+    while len(images) < count:
+        images.append(rng.uniform(-1, 1, (224, 224, 3)).astype(np.float32))
+    return np.stack(images)
+
+
+SAMPLE_COMMENTS = [
+    'great', 'thank you', 'very good service', 'the delivery was late and the food was cold',
+    'friendly driver, everything arrived on time', 'terrible experience, nobody answered my calls',
+    'ok', 'the meals were fresh and well packed', 'not what was promised', 'amazing, will donate again',
+    'the portions were too small for the number of students', 'quick pickup, thanks a lot',
+]
+
+
+def build_keras_model(name):
+    if name == 'mobilenet':
+        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+        return MobileNetV2(weights='imagenet')
+    if name == 'food_embedding':
+        from food_embeddings import build_embedding_model
+        return build_embedding_model()
+    from tensorflow.keras.models import load_model
+    return load_model(os.path.join(BASE_DIR, f'{name}_model.keras'))
+
+
+def sample_inputs(name, count, image_dir=None):
+    return sample_images(count, image_dir) if name in ('mobilenet', 'food_embedding') else sample_food_features(count)
+
+
+# Compare an exported backend with the original model on sample inputs
+def check_parity(name, backend, quantization, count=64, image_dir=None):
+    if name == 'sentiment':
+        from transformers import pipeline
+        reference = pipeline('sentiment-analysis', model=SENTIMENT_MODEL_NAME)
+        os.environ['INFERENCE_BACKEND_SENTIMENT'] = backend
+        os.environ['INFERENCE_QUANTIZATION_SENTIMENT'] = quantization
+        candidate = load_sentiment_backend()
+        expected = reference(SAMPLE_COMMENTS, truncation=True)
+        actual = candidate(SAMPLE_COMMENTS, truncation=True)
+        agreement = np.mean([e['label'] == a['label'] for e, a in zip(expected, actual)])
+        score_diff = max(abs(e['score'] - a['score']) for e, a in zip(expected, actual))
+        return {'model': name, 'agreement': float(agreement), 'maxAbsDiff': float(score_diff)}
+
+    keras_model = build_keras_model(name)
+    inputs = sample_inputs(name, count, image_dir)
+    os.environ[f'INFERENCE_BACKEND_{name.upper()}'] = backend
+    os.environ[f'INFERENCE_QUANTIZATION_{name.upper()}'] = quantization
+    candidate = load_keras_backend(name, lambda: keras_model, lambda: sample_inputs(name, 200, image_dir))
+    expected = keras_model.predict(inputs, verbose=0)
+    actual = candidate.predict(inputs)
+    result = {'model': name, 'maxAbsDiff': float(np.max(np.abs(expected - actual)))}
+    if name == 'mobilenet':
+        # Classification: how often the top-1 ImageNet class is unchanged
+        result['agreement'] = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    else:
+        scale = np.maximum(np.abs(expected), 1.0)
+        result['maxRelDiff'] = float(np.max(np.abs(expected - actual) / scale))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export models to optimized inference backends and check parity')
+    parser.add_argument('command', choices=['export', 'parity'])
+    parser.add_argument('--models', default='mobilenet,food_quantity,food_waste,sentiment')
+    parser.add_argument('--backend', default='tflite', help='tflite or onnx (the sentiment model always uses onnx)')
+    parser.add_argument('--quantization', default='none', choices=QUANTIZATIONS)
+    parser.add_argument('--image-dir', help='Images for int8 calibration and parity (defaults to backend uploads)')
+    parser.add_argument('--samples', type=int, default=64)
+    parser.add_argument('--min-agreement', type=float, default=0.95)
+    parser.add_argument('--max-diff', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    failed = False
+    for name in [n.strip() for n in args.models.split(',') if n.strip()]:
+        backend = 'onnx' if name == 'sentiment' else args.backend
+        quantization = 'dynamic' if backend == 'onnx' and args.quantization == 'int8' else args.quantization
+        if name == 'sentiment' and quantization == 'float16':
+            quantization = 'dynamic'
+        if args.command == 'export':
+            path = export_path(name, backend, quantization)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with FileLock(path):
+                if name == 'sentiment':
+                    export_sentiment_onnx(path, quantization)
+                elif backend == 'tflite':
+                    data = sample_inputs(name, 200, args.image_dir) if quantization == 'int8' else None
+                    export_tflite(build_keras_model(name), path, quantization, data)
+                else:
+                    export_onnx(build_keras_model(name), path, quantization)
+            print(f'{name}: exported to {path}')
+            continue
+
+        result = check_parity(name, backend, quantization, args.samples, args.image_dir)
+        # Regression models are judged on relative error, classifiers on label agreement
+        ok = result.get('agreement', 1.0) >= args.min_agreement and result.get('maxRelDiff', 0.0) <= args.max_diff
+        failed = failed or not ok
+        print(f"{name}: {'OK' if ok else 'FAIL'} {result}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import sys
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# MEMORY_BUDGET=1 trades a little accuracy for a smaller per-worker footprint: Keras
+# models default to float16 TFLite exports and the sentiment model to int8 ONNX (unless
+# a backend is configured for them), and Prophet models drop the training data they
+# do not need to predict. Check the accuracy of the exports with
+# `python inference_backends.py parity --quantization float16` before enabling it.
+MEMORY_BUDGET = os.environ.get('MEMORY_BUDGET', '0') == '1'
+
+MB = 1024 * 1024
+
+
+# Resident set size of this process in bytes, or None where it cannot be read
+def resident_memory():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+# Drop what a fitted Prophet model keeps only for plotting, diagnostics and refits: the
+# training frame (its last row stays, for the forecast start and the data age reported
+# by /forecast/status), the per-row training dates and the Stan fit object. Refits read
+# the full model from its pickle, not from the served one.
+def trim_prophet(model):
+    if getattr(model, 'history', None) is not None:
+        model.history = model.history.tail(1).copy()
+    if getattr(model, 'history_dates', None) is not None:
+        model.history_dates = model.history_dates.tail(1).reset_index(drop=True)
+    if hasattr(model, 'stan_fit'):
+        model.stan_fit = None
+    backend = getattr(model, 'stan_backend', None)
+    if backend is not None and hasattr(backend, 'stan_fit'):
+        backend.stan_fit = None
+    return model
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+# Bytes held by a model object: array buffers, DataFrames, Keras / PyTorch weights and
+# exported model files, found by walking its attributes. An estimate of what the model
+# keeps resident, excluding runtime buffers such as the TFLite arena.
+def estimate_size(value, _seen=None, _depth=0):
+    seen = set() if _seen is None else _seen
+    if id(value) in seen or _depth > 6:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(estimate_size(item, seen, _depth + 1) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item, seen, _depth + 1) for item in value.values())
+
+    module = type(value).__module__ or ''
+    # Keras models
+    if module.startswith(('keras', 'tensorflow')) and hasattr(value, 'get_weights'):
+        return sum(weight.nbytes for weight in value.get_weights())
+    # PyTorch modules, e.g. the model of a transformers pipeline
+    if hasattr(value, 'parameters') and module.startswith(('torch', 'transformers')):
+        return sum(p.numel() * p.element_size() for p in value.parameters())
+    # TFLite / ONNX Runtime wrappers: the exported file is mapped or read into memory
+    if type(value).__name__ in ('TFLiteModel', 'OnnxModel'):
+        return _file_size(value.path)
+    # scikit-learn trees keep their nodes in a Cython object without __dict__
+    if module.startswith('sklearn.tree') and hasattr(value, '__getstate__'):
+        return estimate_size(value.__getstate__(), seen, _depth + 1)
+
+    attributes = getattr(value, '__dict__', None)
+    if attributes is None:
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + sum(estimate_size(item, seen, _depth + 1) for item in attributes.values())
+
+
+# Register GET /health/memory: process RSS and, per model, the estimated size of the
+# loaded object and how much the process RSS grew while it loaded. Load deltas are only
+# indicative: the first TensorFlow or PyTorch model also pays for the runtime, and
+# models loaded before a fork are shared with the workers until written to.
+def init_app(app, registry):
+    from flask import jsonify
+
+    def memory_report():
+        rss = resident_memory()
+        models = {}
+        for name, model in registry.models.items():
+            value = model.value
+            models[name] = {
+                'enabled': model.enabled,
+                'loaded': value is not None,
+                'estimatedMb': round(estimate_size(value) / MB, 2) if value is not None else None,
+                'loadRssDeltaMb': round(model.rss_delta / MB, 2) if model.rss_delta is not None else None,
+            }
+        return jsonify({
+            'rssMb': round(rss / MB, 2) if rss is not None else None,
+            'pid': os.getpid(),
+            'memoryBudget': MEMORY_BUDGET,
+            'models': models,
+        })
+
+    app.add_url_rule('/health/memory', 'health_memory', memory_report, methods=['GET'])
@@ -0,0 +1,103 @@
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, jsonify, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+import prometheus_client
+
+# Latency buckets in seconds, from cache hits up to slow Prophet / image requests
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    'sustainafood_request_latency_seconds', 'Request latency per route',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    'sustainafood_stage_latency_seconds',
+    'Time spent in each stage of a request (validation, preprocessing, inference, serialization)',
+    ['endpoint', 'stage'], buckets=LATENCY_BUCKETS
+)
+ERROR_RESPONSES = Counter('sustainafood_error_responses_total', 'Responses with a 4xx or 5xx status', ['endpoint', 'status'])
+MODEL_NOT_LOADED = Counter('sustainafood_model_not_loaded_total', 'Requests refused because a model was not loaded',
+                           ['endpoint'])
+FORECAST_FIT_SECONDS = Gauge('sustainafood_forecast_fit_seconds', 'Duration of the last Prophet refit', ['series'],
+                             multiprocess_mode='max')
+FORECAST_LAST_OBSERVATION = Gauge('sustainafood_forecast_last_observation_timestamp_seconds',
+                                  'Date of the newest observation in the last refitted forecast model', ['series'],
+                                  multiprocess_mode='max')
+QUEUE_DEPTH = Gauge('sustainafood_admission_queue_depth', 'Requests waiting for a concurrency slot', ['limit'],
+                    multiprocess_mode='livesum')
+SHED_REQUESTS = Counter('sustainafood_shed_requests_total', 'Requests rejected by admission control',
+                        ['limit', 'reason'])
+IN_FLIGHT = Gauge('sustainafood_in_flight_requests', 'Requests currently being handled', ['endpoint'],
+                  multiprocess_mode='livesum')
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+# Time a block of a request handler as one stage of the current endpoint
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(_endpoint(), name).observe(time.perf_counter() - start)
+
+
+# Record a stage that the handler already timed itself
+def observe_stage(name, seconds):
+    STAGE_LATENCY.labels(_endpoint(), name).observe(seconds)
+
+
+# Error response for a model that is not loaded, counted per endpoint
+def model_not_loaded(message):
+    MODEL_NOT_LOADED.labels(_endpoint()).inc()
+    return jsonify({'error': message}), 500
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = _endpoint()
+    IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        endpoint = _endpoint()
+        status = str(response.status_code)
+        REQUEST_LATENCY.labels(endpoint, request.method, status).observe(time.perf_counter() - start)
+        if response.status_code >= 400:
+            ERROR_RESPONSES.labels(endpoint, status).inc()
+    return response
+
+
+def _teardown_request(exc):
+    # Runs even when a handler raised, so the gauge cannot drift upwards
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        IN_FLIGHT.labels(endpoint).dec()
+
+
+def metrics_view():
+    # With several worker processes, merge the per-process files from PROMETHEUS_MULTIPROC_DIR
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+# Register the request hooks and the /metrics route on a Flask app
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view, methods=['GET'])
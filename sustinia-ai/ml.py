@@ -1,244 +1,411 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.models import load_model
 import numpy as np
-from PIL import Image
-from prophet import Prophet
-import pandas as pd
 import joblib
+import os
+import atexit
 import logging
-from transformers import pipeline
+from forecast_cache import MAX_FORECAST_DAYS, ForecastCache
+from forecast_gap import GAP_CACHE_SIZE, RESAMPLE_RULES, forecast_gap
+from response_encoding import negotiated, table_response
+from batching import MicroBatcher
+from admission import DeadlineExceeded, init_app as init_admission
+from caching import LRUCache, SentimentMemo
+from model_registry import ModelRegistry
+from model_admin import init_app as init_model_admin
+from memory_budget import MEMORY_BUDGET, init_app as init_memory_report, trim_prophet
+from forecast_refit import RefitManager, init_app as init_forecast_refit
+from model_checks import (
+    check_feature_encoder, check_food_model, check_forecast_model, check_sentiment_analyzer,
+    check_traffic_model
+)
+from metrics import init_app as init_metrics, model_not_loaded, stage
+from inference_backends import (
+    load_keras_backend, load_sentiment_backend, sample_food_events, sample_food_features
+)
+from route_duration import MAX_BATCH_LEGS, LegEncoder, predict_route_durations
+from feature_encoder import FeatureEncoder
+from satisfaction import (
+    MAX_BATCH_ITEMS, combine_scores, compute_satisfaction_scores, rating_only_score, sentiment_to_score
+)
 
 app = Flask(__name__)
 
 # Configure CORS to allow requests from the frontend
 CORS(app, resources={r"*": {"origins": "http://localhost:5173"}})
 
+# Request latency, stage timings and error counters, served at /metrics
+init_metrics(app)
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load the pre-trained image analysis model
-model = MobileNetV2(weights='imagenet')
+# Models are loaded on first use (or by the warm-up thread below) so the app starts
+# serving immediately; TensorFlow, Prophet and transformers are only imported by the loaders
+registry = ModelRegistry()
 
-# Load Prophet models for forecasting
-try:
-    model_donations = joblib.load('donation_forecast_model2.pkl')
-    model_requests = joblib.load('request_forecast_model2.pkl')
-except FileNotFoundError as e:
-    logger.error(f"Failed to load Prophet models: {e}")
-    model_donations = None
-    model_requests = None
+# Precompute forecasts so the routes only slice cached results
+donation_forecast_cache = ForecastCache('donation')
+request_forecast_cache = ForecastCache('request')
+# /forecast/gap tables keyed by both model versions, horizon and frequency
+forecast_gap_cache = LRUCache(GAP_CACHE_SIZE)
+
+# Load Prophet models for forecasting; in memory-budget mode without their training data
+def load_forecast_model(path):
+    model = joblib.load(path)
+    return trim_prophet(model) if MEMORY_BUDGET else model
+
+def load_donation_forecast_model():
+    return load_forecast_model('donation_forecast_model2.pkl')
+
+def load_request_forecast_model():
+    return load_forecast_model('request_forecast_model2.pkl')
 
 # Load traffic prediction model, weather encoder, and vehicle encoder
-try:
+def load_traffic_model():
     traffic_model = joblib.load('traffic_model.pkl')
     weather_encoder = joblib.load('weather_encoder.pkl')
     vehicle_encoder = joblib.load('vehicle_encoder.pkl')
-except FileNotFoundError as e:
-    logger.error(f"Failed to load traffic model or encoders: {e}")
-    traffic_model = None
-    weather_encoder = None
-    vehicle_encoder = None
+    return traffic_model, weather_encoder, vehicle_encoder, LegEncoder(weather_encoder, vehicle_encoder)
+
+# Load food quantity and waste models on the configured inference backend
+def load_keras_model(name, path):
+    def build():
+        from tensorflow.keras.models import load_model
+        return load_model(path)
+    return load_keras_backend(name, build, representative_data=lambda: sample_food_features(200))
 
-# Load food quantity and waste models
+# Compiled from feature_columns and scaler; maps records straight to scaled feature rows
+def load_feature_encoder():
+    return FeatureEncoder(joblib.load('feature_columns.pkl'), joblib.load('scaler.pkl'))
+
+# Initialize sentiment analysis pipeline on the configured inference backend
+def load_sentiment_analyzer():
+    return load_sentiment_backend('distilbert-base-uncased-finetuned-sst-2-english')
+
+# Models with artifact files are reloaded when the files change (or on POST /admin/reload).
+# A new version is smoke-tested alongside the old one and only then swapped in.
+# The preprocessing artifacts are small pickles, registered first so the warm-up loads them before TensorFlow.
+# TensorFlow and PyTorch models are not fork-safe: serve.py loads them in every worker.
+registry.register('food_features', load_feature_encoder, paths=['feature_columns.pkl', 'scaler.pkl'],
+                  smoke_test=lambda encoder: check_feature_encoder(encoder, sample_food_events(1)[0]))
+registry.register('donation_forecast', load_donation_forecast_model, paths=['donation_forecast_model2.pkl'],
+                  smoke_test=lambda model: check_forecast_model(model, donation_forecast_cache),
+                  activate=donation_forecast_cache.install)
+registry.register('request_forecast', load_request_forecast_model, paths=['request_forecast_model2.pkl'],
+                  smoke_test=lambda model: check_forecast_model(model, request_forecast_cache),
+                  activate=request_forecast_cache.install)
+registry.register('traffic', load_traffic_model, paths=['traffic_model.pkl', 'weather_encoder.pkl', 'vehicle_encoder.pkl'],
+                  smoke_test=check_traffic_model)
+registry.register('food_quantity', lambda: load_keras_model('food_quantity', 'food_quantity_model.keras'),
+                  paths=['food_quantity_model.keras'],
+                  smoke_test=lambda model: check_food_model(model, sample_food_features(4)), fork_safe=False)
+registry.register('food_waste', lambda: load_keras_model('food_waste', 'food_waste_model.keras'),
+                  paths=['food_waste_model.keras'],
+                  smoke_test=lambda model: check_food_model(model, sample_food_features(4)), fork_safe=False)
+registry.register('sentiment', load_sentiment_analyzer, smoke_test=check_sentiment_analyzer,
+                  activate=lambda analyzer, prepared: reset_sentiment_memo(), fork_safe=False)
+
+# X-Model-Version on every response and the POST /admin/reload route
+init_model_admin(app, registry)
+
+# GET /health/memory: process RSS and the memory held by each model
+init_memory_report(app, registry)
+
+# POST /forecast/ingest stores new daily counts and refits the Prophet models in the
+# background; GET /forecast/status reports fit times and data freshness
+refit_manager = RefitManager(registry)
+init_forecast_refit(app, refit_manager)
+
+# Feature importances load eagerly so /waste-factors works without waiting for TensorFlow
 try:
-    food_quantity_model = load_model('food_quantity_model.keras')
-    food_waste_model = load_model('food_waste_model.keras')
-    scaler = joblib.load('scaler.pkl')
-    feature_columns = joblib.load('feature_columns.pkl')
     feature_importance = joblib.load('feature_importance.pkl')
 except FileNotFoundError as e:
-    logger.error(f"Failed to load food models or artifacts: {e}")
-    food_quantity_model = None
-    food_waste_model = None
-    scaler = None
-    feature_columns = None
+    logger.error(f"Failed to load food model artifacts: {e}")
     feature_importance = None
 
-# Initialize sentiment analysis pipeline
-try:
-    sentiment_analyzer = pipeline('sentiment-analysis', model='distilbert-base-uncased-finetuned-sst-2-english')
-except Exception as e:
-    logger.error(f"Failed to initialize sentiment analyzer: {e}")
-    sentiment_analyzer = None
+# Batch concurrent single-row predictions into one forward pass per model
+def predict_food_quantity(rows):
+    return list(registry.get('food_quantity').predict(np.vstack(rows), verbose=0))
+
+def predict_waste(rows):
+    return list(registry.get('food_waste').predict(np.vstack(rows), verbose=0))
+
+food_quantity_batcher = MicroBatcher.from_env('food_quantity', predict_food_quantity, max_batch_size=64, max_wait_ms=2)
+food_waste_batcher = MicroBatcher.from_env('food_waste', predict_waste, max_batch_size=64, max_wait_ms=2)
+
+def analyze_comments(comments):
+    return registry.get('sentiment')(comments, batch_size=len(comments), truncation=True)
+
+sentiment_batcher = MicroBatcher.from_env('sentiment', analyze_comments, max_batch_size=32, max_wait_ms=5)
+
+# Memoize sentiment results for repeated comments, optionally persisted for warm starts
+sentiment_memo = SentimentMemo(
+    maxsize=int(os.environ.get('SENTIMENT_MEMO_SIZE', 10000)),
+    path=os.environ.get('SENTIMENT_MEMO_PATH') or None
+)
+
+# Persist the memo on exit. serve.py registers this in the workers only: the parent
+# process never changes it.
+def save_state():
+    sentiment_memo.save()
+
+atexit.register(save_state)
+
+# Results memoized for a previous sentiment model are stale once a new one is swapped in
+def reset_sentiment_memo():
+    if registry.models['sentiment'].generation:
+        sentiment_memo.clear()
 
 # Function to compute satisfaction score
 def compute_satisfaction_score(rating, comment):
     try:
-        normalized_rating = ((rating - 1) / 4) * 100
         sentiment_score = 50
-        if sentiment_analyzer:
-            result = sentiment_analyzer(comment)[0]
-            sentiment_score = (result['score'] * 100) if result['label'] == 'POSITIVE' else ((1 - result['score']) * 100)
-        satisfaction_score = (0.6 * normalized_rating) + (0.4 * sentiment_score)
-        return round(max(0, min(100, satisfaction_score)))
+        if registry.get('sentiment'):
+            result = sentiment_memo.get(comment)
+            if result is None:
+                result = sentiment_batcher.submit(comment)
+                sentiment_memo.put(comment, result)
+            sentiment_score = sentiment_to_score(result)
+        return combine_scores(rating, sentiment_score)
     except Exception as e:
         logger.error(f"Error computing satisfaction score: {e}")
-        return round(((rating - 1) / 4) * 100)
+        return rating_only_score(rating)
+
+# Required fields for the food demand and food waste models
+DEMAND_FIELDS = [
+    'Number of Guests', 'Type of Food', 'Event Type', 'Storage Conditions',
+    'Purchase History', 'Seasonality', 'Preparation Method', 'Geographical Location', 'Pricing'
+]
+WASTE_FIELDS = [
+    'Number of Guests', 'Quantity of Food', 'Type of Food', 'Event Type',
+    'Storage Conditions', 'Purchase History', 'Seasonality',
+    'Preparation Method', 'Geographical Location', 'Pricing'
+]
+
+# Largest list of events accepted by the bulk routes
+MAX_BULK_EVENTS = int(os.environ.get('FOOD_MAX_BULK_EVENTS', 1000))
 
 # Helper function to preprocess input data
 def preprocess_input(data):
     try:
-        input_data = pd.DataFrame([data])
-        numerical_cols = ['Number of Guests', 'Quantity of Food'] if 'Quantity of Food' in data else ['Number of Guests']
-        for col in numerical_cols:
-            input_data[col] = pd.to_numeric(input_data[col], errors='coerce')
-        if input_data[numerical_cols].isna().any().any():
-            raise ValueError("Invalid numerical inputs")
-
-        categorical_columns = [
-            'Type of Food', 'Event Type', 'Storage Conditions',
-            'Purchase History', 'Seasonality', 'Preparation Method',
-            'Geographical Location', 'Pricing'
-        ]
-        input_encoded = pd.get_dummies(input_data, columns=categorical_columns, drop_first=True)
-
-        for col in feature_columns:
-            if col not in input_encoded.columns:
-                input_encoded[col] = 0
-        input_encoded = input_encoded[feature_columns]
-
-        input_scaled = scaler.transform(input_encoded)
-        return input_scaled
+        return registry.get('food_features').transform_one(data)
     except Exception as e:
         logger.error(f"Error preprocessing input: {e}")
         raise
 
-# Route for image analysis@app.route('/analyze', methods=['POST'])
-def analyze_image():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
-
-    file = request.files['file']
-
-    try:
-        img = Image.open(file.stream).convert('RGB').resize((224, 224))
-    except Exception as e:
-        logger.error(f"Error opening image: {e}")
-        return jsonify({'error': f'Failed to process image: {str(e)}'}), 400
-
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
-
-    predictions = model.predict(img_array)
-    decoded = decode_predictions(predictions, top=3)[0]
-
-    results = [{'description': desc, 'confidence': float(prob)} for (_, desc, prob) in decoded]
-    return jsonify(results)
+# Image analysis (/analyze) is served by app.py
 
 # Route for donation forecasting
 @app.route('/forecast/donations', methods=['GET'])
+@negotiated
 def forecast_donations():
+    model_donations = registry.get('donation_forecast')
     if not model_donations:
-        return jsonify({'error': 'Donation forecast model not loaded'}), 500
+        return model_not_loaded('Donation forecast model not loaded')
     try:
-        days = int(request.args.get('days', 30))
-        if days <= 0:
-            return jsonify({'error': 'Days must be a positive integer'}), 400
-        future = model_donations.make_future_dataframe(periods=days)
-        forecast = model_donations.predict(future)
-        forecast_data = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(days)
-        forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
-        return jsonify(forecast_data.to_dict(orient='records'))
+        with stage('validation'):
+            days = int(request.args.get('days', 30))
+            if days <= 0 or days > MAX_FORECAST_DAYS:
+                return jsonify({'error': f'Days must be an integer between 1 and {MAX_FORECAST_DAYS}'}), 400
+        with stage('inference'):
+            forecast_data = donation_forecast_cache.get(model_donations, days)
+        with stage('serialization'):
+            forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
+            response = table_response(forecast_data)
+        return response
     except Exception as e:
         logger.error(f"Error in donation forecast: {e}")
         return jsonify({'error': f'Failed to generate donation forecast: {str(e)}'}), 500
 
 # Route for request forecasting
 @app.route('/forecast/requests', methods=['GET'])
+@negotiated
 def forecast_requests():
+    model_requests = registry.get('request_forecast')
     if not model_requests:
-        return jsonify({'error': 'Request forecast model not loaded'}), 500
+        return model_not_loaded('Request forecast model not loaded')
     try:
-        days = int(request.args.get('days', 30))
-        if days <= 0:
-            return jsonify({'error': 'Days must be a positive integer'}), 400
-        future = model_requests.make_future_dataframe(periods=days)
-        forecast = model_requests.predict(future)
-        forecast_data = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(days)
-        forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
-        return jsonify(forecast_data.to_dict(orient='records'))
+        with stage('validation'):
+            days = int(request.args.get('days', 30))
+            if days <= 0 or days > MAX_FORECAST_DAYS:
+                return jsonify({'error': f'Days must be an integer between 1 and {MAX_FORECAST_DAYS}'}), 400
+        with stage('inference'):
+            forecast_data = request_forecast_cache.get(model_requests, days)
+        with stage('serialization'):
+            forecast_data['ds'] = forecast_data['ds'].dt.strftime('%Y-%m-%d')
+            response = table_response(forecast_data)
+        return response
     except Exception as e:
         logger.error(f"Error in request forecast: {e}")
         return jsonify({'error': f'Failed to generate request forecast: {str(e)}'}), 500
 
+# Route for donations, requests and their gap in one response, optionally resampled
+# to weekly or monthly totals
+@app.route('/forecast/gap', methods=['GET'])
+@negotiated
+def forecast_supply_gap():
+    model_donations = registry.get('donation_forecast')
+    model_requests = registry.get('request_forecast')
+    if not model_donations or not model_requests:
+        return model_not_loaded('Donation or request forecast model not loaded')
+
+    try:
+        with stage('validation'):
+            days = int(request.args.get('days', 30))
+            if days <= 0 or days > MAX_FORECAST_DAYS:
+                return jsonify({'error': f'Days must be an integer between 1 and {MAX_FORECAST_DAYS}'}), 400
+            freq = request.args.get('freq', 'day')
+            if freq not in RESAMPLE_RULES:
+                return jsonify({'error': f'freq must be one of: {", ".join(RESAMPLE_RULES)}'}), 400
+
+        key = (registry.version('donation_forecast'), registry.version('request_forecast'), days, freq)
+        gap = forecast_gap_cache.get(key)
+        if gap is None:
+            with stage('inference'):
+                donation_data = donation_forecast_cache.get(model_donations, days)
+                request_data = request_forecast_cache.get(model_requests, days)
+                gap = forecast_gap(donation_data, request_data, freq)
+            forecast_gap_cache.put(key, gap)
+        with stage('serialization'):
+            response = table_response(gap, {'days': days, 'freq': freq}, 'periods')
+        return response
+    except Exception as e:
+        logger.error(f"Error in forecast gap: {e}")
+        return jsonify({'error': f'Failed to generate forecast gap: {str(e)}'}), 500
+
 # Route for predicting route duration
 @app.route('/predict_duration', methods=['POST'])
 def predict_duration():
-    if not traffic_model or not weather_encoder or not vehicle_encoder:
-        return jsonify({'error': 'Traffic prediction model or encoders not loaded'}), 500
+    traffic = registry.get('traffic')
+    if not traffic:
+        return model_not_loaded('Traffic prediction model or encoders not loaded')
+    traffic_model, weather_encoder, vehicle_encoder, leg_encoder = traffic
     try:
         data = request.get_json()
-        logger.info(f"Received data for duration prediction: {data}")
-        required_fields = ['distance', 'osrmDuration', 'hour', 'weather', 'vehicleType']
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
-        distance = float(data['distance'])
-        osrm_duration = float(data['osrmDuration'])
-        hour = int(data['hour'])
-        weather = data['weather'].title()
-        vehicle_type = data['vehicleType'].title()
-        if distance <= 0 or osrm_duration <= 0 or hour < 0 or hour > 23:
-            return jsonify({'error': 'Invalid input ranges'}), 400
-        if weather not in weather_encoder.classes_ or vehicle_type not in vehicle_encoder.classes_:
-            return jsonify({'error': 'Invalid weather or vehicle type'}), 400
-        weather_encoded = weather_encoder.transform([weather])[0]
-        vehicle_encoded = vehicle_encoder.transform([vehicle_type])[0]
+        logger.debug('Received data for duration prediction: %s', data)
+        with stage('validation'):
+            required_fields = ['distance', 'osrmDuration', 'hour', 'weather', 'vehicleType']
+            missing_fields = [field for field in required_fields if field not in data]
+            if missing_fields:
+                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+            distance = float(data['distance'])
+            osrm_duration = float(data['osrmDuration'])
+            hour = int(data['hour'])
+            weather = data['weather'].title()
+            vehicle_type = data['vehicleType'].title()
+            if distance <= 0 or osrm_duration <= 0 or hour < 0 or hour > 23:
+                return jsonify({'error': 'Invalid input ranges'}), 400
+            if weather not in weather_encoder.classes_ or vehicle_type not in vehicle_encoder.classes_:
+                return jsonify({'error': 'Invalid weather or vehicle type'}), 400
+        weather_encoded = leg_encoder.weather_codes[weather]
+        vehicle_encoded = leg_encoder.vehicle_codes[vehicle_type]
         distance_meters = distance * 1000
         osrm_duration_minutes = osrm_duration / 60
         hour_normalized = hour / 23.0
         features = np.array([[distance_meters, osrm_duration_minutes, hour_normalized, weather_encoded, vehicle_encoded]])
-        predicted_duration = traffic_model.predict(features)[0] * 60
+        with stage('inference'):
+            predicted_duration = traffic_model.predict(features)[0] * 60
         predicted_duration = max(predicted_duration, 60)
         return jsonify({'predictedDuration': float(predicted_duration)})
     except Exception as e:
         logger.error(f"Error in duration prediction: {e}")
         return jsonify({'error': f'Failed to predict duration: {str(e)}'}), 500
 
+# Route for predicting durations of many legs across candidate routes in one pass
+@app.route('/predict_duration/batch', methods=['POST'])
+def predict_duration_batch():
+    traffic = registry.get('traffic')
+    if not traffic:
+        return model_not_loaded('Traffic prediction model or encoders not loaded')
+    traffic_model, _, _, leg_encoder = traffic
+    try:
+        data = request.get_json()
+        with stage('validation'):
+            # Accept {"routes": [{"legs": [...]}, ...]} or a single route as {"legs": [...]}
+            if isinstance(data, dict) and 'routes' in data:
+                routes = data['routes']
+            else:
+                routes = [data] if isinstance(data, dict) and 'legs' in data else None
+            if not isinstance(routes, list) or not routes:
+                return jsonify({'error': 'Expected "routes" as a non-empty list of {"legs": [...]} objects'}), 400
+            if not all(isinstance(route, dict) and isinstance(route.get('legs'), list) for route in routes):
+                return jsonify({'error': 'Each route must be an object with a "legs" list'}), 400
+            leg_count = sum(len(route['legs']) for route in routes)
+            if leg_count > MAX_BATCH_LEGS:
+                return jsonify({'error': f'At most {MAX_BATCH_LEGS} legs can be predicted per request'}), 400
+        logger.info(f"Received {len(routes)} routes with {leg_count} legs for duration prediction")
+        with stage('inference'):
+            results = predict_route_durations(traffic_model, leg_encoder, [route['legs'] for route in routes])
+        return jsonify({'routes': results})
+    except Exception as e:
+        logger.error(f"Error in batch duration prediction: {e}")
+        return jsonify({'error': f'Failed to predict durations: {str(e)}'}), 500
+
 # Route for computing satisfaction score
 @app.route('/compute_satisfaction', methods=['POST'])
 def compute_satisfaction():
     try:
         data = request.get_json()
-        logger.info(f"Received data for satisfaction score: {data}")
-        required_fields = ['rating', 'comment']
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
-        rating = data['rating']
-        comment = data['comment']
-        if not isinstance(rating, (int, float)) or rating < 1 or rating > 5 or not isinstance(comment, str) or not comment.strip():
-            return jsonify({'error': 'Invalid rating or comment'}), 400
-        satisfaction_score = compute_satisfaction_score(rating, comment)
+        logger.debug('Received data for satisfaction score: %s', data)
+        with stage('validation'):
+            required_fields = ['rating', 'comment']
+            missing_fields = [field for field in required_fields if field not in data]
+            if missing_fields:
+                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+            rating = data['rating']
+            comment = data['comment']
+            if not isinstance(rating, (int, float)) or rating < 1 or rating > 5 or not isinstance(comment, str) or not comment.strip():
+                return jsonify({'error': 'Invalid rating or comment'}), 400
+        with stage('inference'):
+            satisfaction_score = compute_satisfaction_score(rating, comment)
         return jsonify({'satisfactionScore': satisfaction_score})
     except Exception as e:
         logger.error(f"Error in satisfaction score computation: {e}")
         return jsonify({'error': f'Failed to compute satisfaction score: {str(e)}'}), 500
 
+# Route for computing satisfaction scores in bulk
+@app.route('/compute_satisfaction/batch', methods=['POST'])
+@negotiated
+def compute_satisfaction_batch():
+    try:
+        data = request.get_json()
+        with stage('validation'):
+            items = data.get('items') if isinstance(data, dict) else None
+            if not isinstance(items, list) or not items:
+                return jsonify({'error': 'Items must be a non-empty list of {rating, comment} objects'}), 400
+            if len(items) > MAX_BATCH_ITEMS:
+                return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items can be scored per request'}), 400
+        logger.info(f"Received {len(items)} items for batch satisfaction scoring")
+        # Invalid items are reported individually and do not fail the batch
+        with stage('inference'):
+            results = compute_satisfaction_scores(registry.get('sentiment'), items, memo=sentiment_memo)
+        return table_response(results, key='results')
+    except Exception as e:
+        logger.error(f"Error in batch satisfaction score computation: {e}")
+        return jsonify({'error': f'Failed to compute satisfaction scores: {str(e)}'}), 500
+
 # Route for forecasting food demand
 @app.route('/forecast_food_demand', methods=['POST'])
 def forecast_food_demand():
-    if not food_quantity_model or not scaler or not feature_columns:
-        return jsonify({'error': 'Food demand model or artifacts not loaded'}), 500
+    if not registry.get('food_quantity') or not registry.get('food_features'):
+        return model_not_loaded('Food demand model or artifacts not loaded')
     try:
         data = request.get_json()
-        logger.info(f"Received data for food demand forecasting: {data}")
-        required_fields = [
-            'Number of Guests', 'Type of Food', 'Event Type', 'Storage Conditions',
-            'Purchase History', 'Seasonality', 'Preparation Method', 'Geographical Location', 'Pricing'
-        ]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
-        input_scaled = preprocess_input(data)
-        prediction = food_quantity_model.predict(input_scaled, verbose=0)[0][0]
+        logger.debug('Received data for food demand forecasting: %s', data)
+        with stage('validation'):
+            missing_fields = [field for field in DEMAND_FIELDS if field not in data]
+            if missing_fields:
+                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        with stage('preprocessing'):
+            input_scaled = preprocess_input(data)
+        with stage('inference'):
+            prediction = food_quantity_batcher.submit(input_scaled)[0]
         prediction = max(0, prediction)
         return jsonify({'predictedQuantity': float(prediction)})
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error in food demand forecasting: {e}")
         return jsonify({'error': f'Failed to forecast food demand: {str(e)}'}), 500
@@ -246,32 +413,124 @@ def forecast_food_demand():
 # Route for predicting food waste
 @app.route('/predict_food_waste', methods=['POST'])
 def predict_food_waste():
-    if not food_waste_model or not scaler or not feature_columns:
-        return jsonify({'error': 'Food waste model or artifacts not loaded'}), 500
+    if not registry.get('food_waste') or not registry.get('food_features'):
+        return model_not_loaded('Food waste model or artifacts not loaded')
     try:
         data = request.get_json()
-        logger.info(f"Received data for food waste prediction: {data}")
-        required_fields = [
-            'Number of Guests', 'Quantity of Food', 'Type of Food', 'Event Type',
-            'Storage Conditions', 'Purchase History', 'Seasonality',
-            'Preparation Method', 'Geographical Location', 'Pricing'
-        ]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
-        input_scaled = preprocess_input(data)
-        prediction = food_waste_model.predict(input_scaled, verbose=0)[0][0]
+        logger.debug('Received data for food waste prediction: %s', data)
+        with stage('validation'):
+            missing_fields = [field for field in WASTE_FIELDS if field not in data]
+            if missing_fields:
+                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        with stage('preprocessing'):
+            input_scaled = preprocess_input(data)
+        with stage('inference'):
+            prediction = food_waste_batcher.submit(input_scaled)[0]
         prediction = max(0, prediction)
         return jsonify({'predictedWaste': float(prediction)})
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error in food waste prediction: {e}")
         return jsonify({'error': f'Failed to predict food waste: {str(e)}'}), 500
 
+# Helper for the bulk routes: validates and encodes every event in one pass.
+# Returns the scaled rows of the valid events, their positions in the input, and a
+# results list holding an error entry for every invalid event.
+def preprocess_events(events, required_fields):
+    results = [None] * len(events)
+    candidates = []
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            results[index] = {'index': index, 'error': 'Event must be an object'}
+            continue
+        missing_fields = [field for field in required_fields if field not in event]
+        if missing_fields:
+            results[index] = {'index': index, 'error': f'Missing required fields: {", ".join(missing_fields)}'}
+            continue
+        candidates.append(index)
+
+    input_scaled, errors = registry.get('food_features').transform_partial([events[i] for i in candidates])
+    valid = []
+    for index, error in zip(candidates, errors):
+        if error:
+            results[index] = {'index': index, 'error': error}
+        else:
+            valid.append(index)
+    return input_scaled, valid, results
+
+# Run one batched forward pass and clip predictions at zero like the single routes
+def predict_rows(keras_model, input_scaled):
+    if len(input_scaled) == 0:
+        return np.zeros(0)
+    predictions = keras_model.predict(input_scaled, batch_size=min(len(input_scaled), 1024), verbose=0)
+    return np.maximum(predictions[:, 0], 0)
+
+# Shared body of the bulk routes; outputs maps a response key to a registered model name
+def predict_events_batch(required_fields, outputs):
+    data = request.get_json()
+    with stage('validation'):
+        events = data.get('events') if isinstance(data, dict) else None
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'Events must be a non-empty list of event records'}), 400
+        if len(events) > MAX_BULK_EVENTS:
+            return jsonify({'error': f'At most {MAX_BULK_EVENTS} events can be predicted per request'}), 400
+    logger.info(f"Received {len(events)} events for bulk prediction of {', '.join(outputs)}")
+
+    with stage('preprocessing'):
+        input_scaled, valid, results = preprocess_events(events, required_fields)
+    with stage('inference'):
+        predictions = {key: predict_rows(registry.get(name), input_scaled) for key, name in outputs.items()}
+    with stage('serialization'):
+        for row, index in enumerate(valid):
+            results[index] = {'index': index}
+            for key in outputs:
+                results[index][key] = float(predictions[key][row])
+        response = table_response(results, key='results')
+    return response
+
+# Route for forecasting food demand for many events
+@app.route('/forecast_food_demand/batch', methods=['POST'])
+@negotiated
+def forecast_food_demand_batch():
+    if not registry.get('food_quantity') or not registry.get('food_features'):
+        return model_not_loaded('Food demand model or artifacts not loaded')
+    try:
+        return predict_events_batch(DEMAND_FIELDS, {'predictedQuantity': 'food_quantity'})
+    except Exception as e:
+        logger.error(f"Error in bulk food demand forecasting: {e}")
+        return jsonify({'error': f'Failed to forecast food demand: {str(e)}'}), 500
+
+# Route for predicting food waste for many events
+@app.route('/predict_food_waste/batch', methods=['POST'])
+@negotiated
+def predict_food_waste_batch():
+    if not registry.get('food_waste') or not registry.get('food_features'):
+        return model_not_loaded('Food waste model or artifacts not loaded')
+    try:
+        return predict_events_batch(WASTE_FIELDS, {'predictedWaste': 'food_waste'})
+    except Exception as e:
+        logger.error(f"Error in bulk food waste prediction: {e}")
+        return jsonify({'error': f'Failed to predict food waste: {str(e)}'}), 500
+
+# Route for predicting both quantity and waste for many events.
+# Both models share scaler and feature_columns, so each event is encoded once.
+@app.route('/predict_food_event/batch', methods=['POST'])
+@negotiated
+def predict_food_event_batch():
+    if not registry.get('food_quantity') or not registry.get('food_waste') or not registry.get('food_features'):
+        return model_not_loaded('Food models or artifacts not loaded')
+    try:
+        return predict_events_batch(WASTE_FIELDS, {'predictedQuantity': 'food_quantity', 'predictedWaste': 'food_waste'})
+    except Exception as e:
+        logger.error(f"Error in bulk food event prediction: {e}")
+        return jsonify({'error': f'Failed to predict food quantity and waste: {str(e)}'}), 500
+
 # Route for waste factors
 @app.route('/waste-factors', methods=['GET'])
 def get_waste_factors():
     if feature_importance is None:
-        return jsonify({'error': 'Feature importance data not loaded'}), 500
+        return model_not_loaded('Feature importance data not loaded')
     try:
         # Convert DataFrame to dictionary with feature and importance
         factors = feature_importance.set_index('feature')['importance'].to_dict()
@@ -280,5 +539,19 @@ def get_waste_factors():
         logger.error(f"Error processing waste factors: {e}")
         return jsonify({'error': f'Failed to load waste factors: {str(e)}'}), 500
 
+# Route for readiness: reports which models are loaded and how long each load took
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    ready = registry.ready()
+    return jsonify({'ready': ready, 'models': registry.status()}), 200 if ready else 503
+
+# Per-endpoint concurrency limits, wait queues and deadlines, set up for the routes above
+init_admission(app)
+
+# Start loading models in the background without blocking startup
+registry.warm_up()
+registry.watch()
+
+# Development server; use serve.py for production
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(debug=True, port=int(os.environ.get('PORT', 5001)))
\ No newline at end of file
@@ -0,0 +1,48 @@
+import os
+import hmac
+
+from flask import jsonify, request
+
+from model_registry import served_versions, track_served_versions
+
+# Shared secret for the admin routes, sent as X-Admin-Token. Without it they only
+# accept requests from the local machine.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+
+def authorized():
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+def _after_request(response):
+    # Report the version of every model used for this response, e.g. "food_features=1a2b3c4d5e6f, food_waste=..."
+    versions = served_versions()
+    if versions:
+        response.headers['X-Model-Version'] = ', '.join(f'{name}={version}' for name, version in sorted(versions.items()))
+    return response
+
+
+# Register the model version header and the admin reload route on a Flask app
+def init_app(app, registry):
+    def reload_models():
+        if not authorized():
+            return jsonify({'error': 'Not authorized'}), 403
+        data = request.get_json(silent=True) or {}
+        names = data.get('models') if isinstance(data, dict) else None
+        if names is not None:
+            if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+                return jsonify({'error': 'models must be a list of model names'}), 400
+            unknown = [name for name in names if name not in registry.models]
+            if unknown:
+                return jsonify({'error': f'Unknown models: {", ".join(unknown)}. '
+                                         f'Expected some of: {", ".join(registry.models)}'}), 400
+        # The new versions load here while other requests keep being served by the old ones
+        results = registry.reload(names)
+        failed = any(result['status'] == 'failed' for result in results)
+        return jsonify({'results': results}), 500 if failed else 200
+
+    app.before_request(track_served_versions)
+    app.after_request(_after_request)
+    app.add_url_rule('/admin/reload', 'admin_reload', reload_models, methods=['POST'])
@@ -0,0 +1,60 @@
+import numpy as np
+
+# Smoke predictions run on every newly loaded model before it is swapped in.
+# Each check raises ValueError when the model cannot produce a sensible prediction.
+
+
+def _require(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+def check_image_model(model):
+    predictions = np.asarray(model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0))
+    _require(predictions.shape == (1, 1000), f'Expected 1000 class scores, got shape {predictions.shape}')
+    _require(np.isfinite(predictions).all(), 'Class scores are not finite')
+
+
+def check_embedding_model(model):
+    embeddings = np.asarray(model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0))
+    _require(embeddings.ndim == 2 and len(embeddings) == 1, f'Expected one embedding, got shape {embeddings.shape}')
+    _require(np.isfinite(embeddings).all(), 'Embedding is not finite')
+
+
+def check_food_head(head):
+    scores = head.predict(np.zeros((1, head.embedding_size), dtype=np.float32))
+    _require(np.isfinite(scores).all() and abs(float(scores.sum()) - 1.0) < 1e-3, 'Class scores are not a distribution')
+
+
+# Computes the full cached forecast, returned so it can be installed with the model
+def check_forecast_model(model, forecast_cache):
+    forecast = forecast_cache.prepare(model)
+    _require(len(forecast) > 0, 'Forecast is empty')
+    _require(np.isfinite(forecast['yhat'].to_numpy(dtype=np.float64)).all(), 'Forecast contains non-finite values')
+    return forecast
+
+
+def check_traffic_model(traffic):
+    traffic_model, _, _, leg_encoder = traffic
+    leg = {'distance': 5, 'osrmDuration': 600, 'hour': 12,
+           'weather': leg_encoder.weather_classes[0], 'vehicleType': leg_encoder.vehicle_classes[0]}
+    prediction = np.asarray(traffic_model.predict(np.array([leg_encoder.encode(leg)])), dtype=np.float64)
+    _require(prediction.shape == (1,) and np.isfinite(prediction).all(), f'Unexpected duration prediction {prediction}')
+
+
+def check_sentiment_analyzer(analyzer):
+    results = analyzer(['the food arrived fresh and on time'], truncation=True)
+    _require(results and results[0].get('label') in ('POSITIVE', 'NEGATIVE'), f'Unexpected sentiment result {results}')
+
+
+# Food models take the rows produced by the feature encoder
+def check_food_model(model, features):
+    predictions = np.asarray(model.predict(features, verbose=0))
+    _require(predictions.shape == (len(features), 1), f'Expected one prediction per row, got shape {predictions.shape}')
+    _require(np.isfinite(predictions).all(), 'Predictions are not finite')
+
+
+def check_feature_encoder(encoder, event):
+    row = encoder.transform_one(event)
+    _require(row.shape == (1, len(encoder.feature_columns)), f'Unexpected feature row shape {row.shape}')
+    _require(np.isfinite(row).all(), 'Scaled features are not finite')
@@ -0,0 +1,301 @@
+import os
+import time
+import hashlib
+import threading
+import contextvars
+import logging
+
+from memory_budget import resident_memory
+
+logger = logging.getLogger(__name__)
+
+# Versions of the models used by the current request, recorded by ModelRegistry.get
+# once track_served_versions() has been called for the request
+_served_versions = contextvars.ContextVar('served_versions', default=None)
+
+
+def track_served_versions():
+    _served_versions.set({})
+
+
+def served_versions():
+    return _served_versions.get() or {}
+
+
+# Seconds between checks of the model artifact files; 0 disables the watcher
+def watch_interval():
+    return float(os.environ.get('MODEL_WATCH_INTERVAL', 5))
+
+
+# Models this process may load: ENABLED_MODELS is "all" (default) or a comma-separated
+# list of model names. Routes of disabled models answer as if the model failed to load.
+def enabled_models():
+    setting = os.environ.get('ENABLED_MODELS', 'all').strip()
+    if setting == 'all':
+        return None
+    return {name.strip() for name in setting.split(',') if name.strip()}
+
+
+# Cheap fingerprint of the artifact files used to notice that they changed
+def artifact_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+# Version reported for a model: the start of the SHA-256 of its artifact files
+def artifact_version(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+# A model that is loaded on first use and can be reloaded while serving.
+# The loader runs at most once until reload(); if it fails the error is logged and
+# get() returns None, matching how the routes already treat models that could not be loaded.
+# paths are the artifact files the model is built from: they give its version and are
+# watched for changes. smoke_test(value) runs on every newly loaded value and raises if it
+# cannot predict; its return value is handed to activate(value, prepared), which runs
+# just before the new value is swapped in (e.g. to cache its forecast). fork_safe=False
+# marks models whose runtime (TensorFlow, PyTorch, ONNX Runtime) keeps threads or other
+# per-process state, so serve.py loads them in each worker instead of before the fork.
+class LazyModel:
+    def __init__(self, name, loader, paths=(), smoke_test=None, activate=None, enabled=True, fork_safe=True):
+        self.name = name
+        self.loader = loader
+        self.paths = list(paths)
+        self.smoke_test = smoke_test
+        self.activate = activate
+        # The value and its version are replaced together in a single assignment, so a
+        # request sees either the old pair or the new one. Requests that already hold
+        # the old value finish with it.
+        self.current = (None, None)
+        self.loaded = False
+        self.error = None
+        self.load_seconds = None
+        self.signature = None
+        self.failed_signature = None
+        self.generation = 0
+        self.reloads = 0
+        self.reload_error = None
+        # Growth of the process RSS while the current value loaded
+        self.rss_delta = None
+        self.enabled = enabled
+        self.fork_safe = fork_safe
+        if not enabled:
+            # Never loaded: get() returns None right away
+            self.loaded = True
+            self.error = 'Disabled by ENABLED_MODELS'
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self.current[0]
+
+    @property
+    def version(self):
+        return self.current[1]
+
+    def get(self):
+        return self.get_versioned()[0]
+
+    def get_versioned(self):
+        if self.loaded:
+            return self.current
+        with self._lock:
+            if not self.loaded:
+                self._load()
+        return self.current
+
+    def _load(self):
+        logger.info(f"Loading model {self.name}")
+        start = time.perf_counter()
+        rss_before = resident_memory()
+        try:
+            self._swap(*self._build())
+            self._record_rss(rss_before)
+        except Exception as e:
+            logger.error(f"Failed to load model {self.name}: {e}")
+            self.current = (None, None)
+            self.error = str(e)
+        self.load_seconds = round(time.perf_counter() - start, 3)
+        self.loaded = True
+        if self.error is None:
+            logger.info(f"Loaded model {self.name} version {self.version} in {self.load_seconds}s")
+
+    def _record_rss(self, rss_before):
+        rss_after = resident_memory()
+        if rss_before is not None and rss_after is not None:
+            self.rss_delta = rss_after - rss_before
+
+    # Load and smoke-test a new value while the current one keeps serving
+    def _build(self):
+        # Fingerprint before loading, so a file replaced mid-load is picked up again
+        signature = artifact_signature(self.paths)
+        version = artifact_version(self.paths) if self.paths else str(self.generation + 1)
+        value = self.loader()
+        prepared = self.smoke_test(value) if self.smoke_test else None
+        return value, version, signature, prepared
+
+    def _swap(self, value, version, signature, prepared):
+        if self.activate:
+            self.activate(value, prepared)
+        self.current = (value, version)
+        self.signature = signature
+        self.generation += 1
+
+    # Load the model again from its artifacts and swap it in if it passes the smoke test.
+    # On failure the current version keeps serving.
+    def reload(self):
+        if not self.enabled:
+            return {'model': self.name, 'status': 'disabled', 'version': None}
+        with self._lock:
+            previous = self.version
+            logger.info(f"Reloading model {self.name} (serving version {previous})")
+            start = time.perf_counter()
+            rss_before = resident_memory()
+            try:
+                build = self._build()
+            except Exception as e:
+                logger.error(f"Reload of model {self.name} failed, still serving version {previous}: {e}")
+                self.reload_error = str(e)
+                # Do not retry the same broken files on every watcher check
+                self.failed_signature = artifact_signature(self.paths)
+                return {'model': self.name, 'status': 'failed', 'version': previous, 'error': str(e)}
+            self._swap(*build)
+            # Includes the previous version, which is freed once its last request finishes
+            self._record_rss(rss_before)
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self.loaded = True
+            self.error = None
+            self.reload_error = None
+            self.failed_signature = None
+            self.reloads += 1
+            logger.info(f"Swapped model {self.name} from version {previous} to {self.version} "
+                        f"after {self.load_seconds}s")
+            return {'model': self.name, 'status': 'swapped', 'version': self.version,
+                    'previousVersion': previous, 'loadSeconds': self.load_seconds}
+
+    # True when the artifact files differ from the loaded (or last failed) version
+    def artifacts_changed(self):
+        if not self.enabled or not self.paths or not self.loaded:
+            return False
+        signature = artifact_signature(self.paths)
+        return signature != self.signature and signature != self.failed_signature
+
+    def status(self):
+        return {
+            'loaded': self.loaded and self.error is None,
+            'enabled': self.enabled,
+            'version': self.version,
+            'loadSeconds': self.load_seconds,
+            'error': self.error,
+            'reloads': self.reloads,
+            'reloadError': self.reload_error,
+        }
+
+
+# Named lazy models for one service, with optional background warm-up and hot reload
+class ModelRegistry:
+    def __init__(self):
+        self.models = {}
+        self.warmup_done = threading.Event()
+        self.warmup_thread = None
+        self.watch_thread = None
+
+    def register(self, name, loader, paths=(), smoke_test=None, activate=None, fork_safe=True):
+        enabled = enabled_models()
+        self.models[name] = LazyModel(name, loader, paths, smoke_test, activate,
+                                      enabled=enabled is None or name in enabled, fork_safe=fork_safe)
+        if not self.models[name].enabled:
+            logger.info(f"Model {name} is disabled by ENABLED_MODELS")
+        return self.models[name]
+
+    def get(self, name):
+        value, version = self.models[name].get_versioned()
+        self._record(name, value, version)
+        return value
+
+    # Version of a model without loading it (None if it is not loaded)
+    def version(self, name):
+        value, version = self.models[name].current
+        self._record(name, value, version)
+        return version
+
+    def _record(self, name, value, version):
+        served = _served_versions.get()
+        if served is not None and value is not None:
+            served[name] = version
+
+    def load_all(self, names=None):
+        for name in list(self.models) if names is None else names:
+            self.models[name].get()
+        self.warmup_done.set()
+
+    # Load models in a background thread so the app can serve requests right away.
+    # WARMUP_MODELS selects what to load: "all" (default), "none", or a comma-separated list.
+    def warm_up(self, names=None):
+        if names is None:
+            setting = os.environ.get('WARMUP_MODELS', 'all').strip()
+            if setting == 'none':
+                self.warmup_done.set()
+                return None
+            names = list(self.models) if setting == 'all' else [n.strip() for n in setting.split(',') if n.strip()]
+        unknown = [name for name in names if name not in self.models]
+        if unknown:
+            logger.error(f"Ignoring unknown models in warm-up list: {', '.join(unknown)}")
+        names = [name for name in names if name in self.models]
+        self.warmup_thread = threading.Thread(target=self.load_all, args=(names,), name='model-warmup', daemon=True)
+        self.warmup_thread.start()
+        return self.warmup_thread
+
+    # Reload models (all of them by default) one at a time and report each outcome
+    def reload(self, names=None):
+        return [self.models[name].reload() for name in (list(self.models) if names is None else names)]
+
+    # Check the artifact files every interval seconds (MODEL_WATCH_INTERVAL by default)
+    # and reload the models whose files changed. A change is acted on once the files have
+    # stayed the same for one interval, so a copy in progress is not loaded half-written.
+    def watch(self, interval=None):
+        interval = watch_interval() if interval is None else interval
+        if interval <= 0 or not any(model.paths for model in self.models.values()):
+            return None
+        self.watch_thread = threading.Thread(target=self._watch, args=(interval,), name='model-watcher', daemon=True)
+        self.watch_thread.start()
+        return self.watch_thread
+
+    def _watch(self, interval):
+        pending = {}
+        while True:
+            time.sleep(interval)
+            for name, model in list(self.models.items()):
+                try:
+                    if not model.artifacts_changed():
+                        pending.pop(name, None)
+                        continue
+                    signature = artifact_signature(model.paths)
+                    if pending.get(name) == signature:
+                        pending.pop(name)
+                        model.reload()
+                    else:
+                        pending[name] = signature
+                except Exception as e:
+                    logger.error(f"Error while watching model {name}: {e}")
+
+    # Ready once warm-up has finished, unless every enabled model that was loaded failed
+    def ready(self):
+        if not self.warmup_done.is_set():
+            return False
+        enabled = [model for model in self.models.values() if model.enabled]
+        return not enabled or any(not model.loaded or model.error is None for model in enabled)
+
+    def status(self):
+        return {name: model.status() for name, model in self.models.items()}
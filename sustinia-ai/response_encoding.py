@@ -0,0 +1,153 @@
+import json
+import functools
+
+import pandas as pd
+from flask import Response, g, jsonify, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response formats for tabular results (forecasts and batch results), chosen with
+# ?format=<name> or the Accept header. "json" is the list of records clients already
+# get; "columnar" is one JSON array per field; msgpack and arrow are columnar binary
+# formats that need the msgpack / pyarrow packages.
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.sustainafood.columnar+json',
+    'msgpack': 'application/msgpack',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+MEDIA_TYPE_ALIASES = {'application/x-msgpack': 'msgpack'}
+OPTIONAL_PACKAGES = {'msgpack': 'msgpack', 'arrow': 'pyarrow'}
+
+_FORMATS_BY_MEDIA_TYPE = dict({media_type: name for name, media_type in MEDIA_TYPES.items()}, **MEDIA_TYPE_ALIASES)
+
+
+class UnsupportedFormat(ValueError):
+    def __init__(self, message, status=406):
+        super().__init__(message)
+        self.status = status
+
+
+def _available(name):
+    package = OPTIONAL_PACKAGES.get(name)
+    if package is None:
+        return True
+    try:
+        __import__(package)
+        return True
+    except ImportError:
+        return False
+
+
+# Format requested by the current request. The query parameter wins over Accept, and
+# Accept headers that match none of the formats (or */*) get the default JSON records.
+def negotiate():
+    name = request.args.get('format')
+    if name is not None:
+        if name not in MEDIA_TYPES:
+            raise UnsupportedFormat(f'format must be one of: {", ".join(MEDIA_TYPES)}', 400)
+    else:
+        # Offered in preference order, so wildcards resolve to the current JSON format
+        best = request.accept_mimetypes.best_match(list(_FORMATS_BY_MEDIA_TYPE), default=MEDIA_TYPES['json'])
+        name = _FORMATS_BY_MEDIA_TYPE[best]
+    if not _available(name):
+        raise UnsupportedFormat(f'{name} responses need the {OPTIONAL_PACKAGES[name]} package on the server')
+    return name
+
+
+# Negotiate the response format before the view runs, so an unsupported format is a
+# 400/406 rather than an error inside the route
+def negotiated(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            g.response_format = negotiate()
+        except UnsupportedFormat as e:
+            return jsonify({'error': str(e)}), e.status
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Fast JSON for plain Python values: orjson when installed, with sorted keys like jsonify
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+
+
+def _columns(table):
+    if isinstance(table, pd.DataFrame):
+        return {name: table[name] for name in table.columns}
+    # Rows can have different keys (e.g. error entries in batch results); missing values are null
+    names = list(dict.fromkeys(key for row in table for key in row))
+    return {name: [row.get(name) for row in table] for name in names}
+
+
+def _encode_column(values):
+    if isinstance(values, pd.Series):
+        return values.to_json(orient='values', double_precision=15).encode()
+    return dumps(values)
+
+
+def _encode_records(table):
+    if isinstance(table, pd.DataFrame):
+        # Written by pandas' C encoder without building a dict per row
+        return table.to_json(orient='records', double_precision=15).encode()
+    return dumps(table)
+
+
+# JSON object from already encoded member values, keys sorted like jsonify
+def _join_object(members):
+    return b'{' + b','.join(dumps(key) + b':' + value for key, value in sorted(members.items())) + b'}'
+
+
+def _plain(values):
+    return values.tolist() if isinstance(values, pd.Series) else values
+
+
+def _arrow_table(table, envelope):
+    import pyarrow as pa
+    if isinstance(table, pd.DataFrame):
+        arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    else:
+        arrow_table = pa.Table.from_pylist(table)
+    # Envelope fields travel as JSON-encoded schema metadata
+    metadata = {key: json.dumps(value) for key, value in envelope.items()}
+    return arrow_table.replace_schema_metadata(metadata or None)
+
+
+def encode_table(table, name, envelope=None, key=None):
+    envelope = envelope or {}
+    if name == 'arrow':
+        import pyarrow as pa
+        arrow_table = _arrow_table(table, envelope)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        return sink.getvalue().to_pybytes()
+    if name == 'msgpack':
+        import msgpack
+        columns = {column: _plain(values) for column, values in _columns(table).items()}
+        return msgpack.packb(dict(envelope, **{key: columns}) if key else columns)
+
+    if name == 'columnar':
+        body = _join_object({column: _encode_column(values) for column, values in _columns(table).items()})
+    else:
+        body = _encode_records(table)
+    if key is None:
+        return body
+    members = {field: dumps(value) for field, value in envelope.items()}
+    members[key] = body
+    return _join_object(members)
+
+
+# Response for a table (a DataFrame or a list of row dicts) in the negotiated format.
+# With key set, the table is returned as envelope[key] (e.g. {"results": [...]}).
+def table_response(table, envelope=None, key=None):
+    name = g.get('response_format', 'json')
+    response = Response(encode_table(table, name, envelope, key), mimetype=MEDIA_TYPES[name])
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+
+REQUIRED_FIELDS = ['distance', 'osrmDuration', 'hour', 'weather', 'vehicleType']
+
+# Largest number of legs (across all routes) accepted by the batch route
+MAX_BATCH_LEGS = int(os.environ.get('DURATION_MAX_BATCH_LEGS', 5000))
+
+# Shortest duration ever returned, in seconds
+MIN_DURATION_SECONDS = 60
+
+
+# Precomputed category lookups for the traffic model.
+# LabelEncoder.transform maps a class to its position in classes_, so a dict built
+# once gives the same codes without a transform call per leg.
+class LegEncoder:
+    def __init__(self, weather_encoder, vehicle_encoder):
+        self.weather_classes = list(weather_encoder.classes_)
+        self.vehicle_classes = list(vehicle_encoder.classes_)
+        self.weather_codes = {value: code for code, value in enumerate(self.weather_classes)}
+        self.vehicle_codes = {value: code for code, value in enumerate(self.vehicle_classes)}
+
+    # Validate one leg and return its feature row, or raise ValueError with the
+    # message the single-leg route would send back
+    def encode(self, leg):
+        if not isinstance(leg, dict):
+            raise ValueError('Leg must be an object')
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in leg]
+        if missing_fields:
+            raise ValueError(f'Missing required fields: {", ".join(missing_fields)}')
+
+        try:
+            distance = float(leg['distance'])  # in km
+            osrm_duration = float(leg['osrmDuration'])  # in seconds
+            hour = int(leg['hour'])
+            weather = leg['weather'].title()
+            vehicle_type = leg['vehicleType'].title()
+        except (TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f'Invalid input format: {str(e)}')
+
+        if distance <= 0:
+            raise ValueError('Distance must be positive')
+        if osrm_duration <= 0:
+            raise ValueError('OSRM duration must be positive')
+        if hour < 0 or hour > 23:
+            raise ValueError('Hour must be between 0 and 23')
+        if weather not in self.weather_codes:
+            raise ValueError(f'Invalid weather value: "{weather}". Expected one of: {", ".join(self.weather_classes)}')
+        if vehicle_type not in self.vehicle_codes:
+            raise ValueError(
+                f'Invalid vehicle type: "{vehicle_type}". Expected one of: {", ".join(self.vehicle_classes)}'
+            )
+
+        # Same normalization as the single-leg route: meters, minutes, hour in [0, 1]
+        return (distance * 1000, osrm_duration / 60, hour / 23.0,
+                self.weather_codes[weather], self.vehicle_codes[vehicle_type])
+
+
+# Score every leg of every route with one traffic_model.predict call.
+# routes is a list of leg lists. Returns one entry per route with per-leg durations
+# (or per-leg errors) and the route total, which is None when any leg is invalid.
+def predict_route_durations(traffic_model, leg_encoder, routes):
+    rows = []
+    positions = []
+    route_results = []
+    for route_index, legs in enumerate(routes):
+        leg_results = []
+        for leg_index, leg in enumerate(legs):
+            try:
+                rows.append(leg_encoder.encode(leg))
+                positions.append((route_index, leg_index))
+                leg_results.append(None)
+            except ValueError as e:
+                leg_results.append({'error': str(e)})
+        route_results.append({'legs': leg_results})
+
+    if rows:
+        features = np.array(rows, dtype=np.float64)
+        # Model predicts minutes; convert to seconds and apply the one-minute floor
+        durations = np.maximum(np.asarray(traffic_model.predict(features), dtype=np.float64) * 60, MIN_DURATION_SECONDS)
+        for (route_index, leg_index), duration in zip(positions, durations):
+            route_results[route_index]['legs'][leg_index] = {'predictedDuration': float(duration)}
+
+    for route in route_results:
+        valid = all('predictedDuration' in leg for leg in route['legs'])
+        route['totalDuration'] = sum(leg['predictedDuration'] for leg in route['legs']) if valid else None
+    return route_results
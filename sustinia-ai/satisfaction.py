@@ -0,0 +1,103 @@
+import os
+import logging
+
+from caching import normalize_comment
+
+logger = logging.getLogger(__name__)
+
+# Number of comments sent through the transformer in one padded forward pass
+SENTIMENT_BATCH_SIZE = int(os.environ.get('SENTIMENT_BATCH_SIZE', 32))
+# Largest list accepted by the batch endpoint
+MAX_BATCH_ITEMS = int(os.environ.get('SATISFACTION_MAX_BATCH_ITEMS', 1000))
+
+
+# Convert a pipeline result to a 0-100 sentiment score
+def sentiment_to_score(result):
+    return (result['score'] * 100) if result['label'] == 'POSITIVE' else ((1 - result['score']) * 100)
+
+
+# Weighted combination: 60% rating, 40% sentiment
+def combine_scores(rating, sentiment_score):
+    normalized_rating = ((rating - 1) / 4) * 100
+    satisfaction_score = (0.6 * normalized_rating) + (0.4 * sentiment_score)
+    return round(max(0, min(100, satisfaction_score)))
+
+
+# Fallback used when sentiment analysis fails
+def rating_only_score(rating):
+    return round(((rating - 1) / 4) * 100)
+
+
+# Returns an error message for an invalid {rating, comment} item, or None
+def validate_item(item):
+    if not isinstance(item, dict):
+        return 'Item must be an object with rating and comment'
+    missing_fields = [field for field in ['rating', 'comment'] if field not in item]
+    if missing_fields:
+        return f'Missing required fields: {", ".join(missing_fields)}'
+    rating = item['rating']
+    comment = item['comment']
+    if isinstance(rating, bool) or not isinstance(rating, (int, float)) or rating < 1 or rating > 5:
+        return 'Rating must be a number between 1 and 5'
+    if not isinstance(comment, str) or not comment.strip():
+        return 'Comment must be a non-empty string'
+    return None
+
+
+# Run the sentiment pipeline over many comments and return 0-100 scores in input order.
+# Comments found in the memo are not sent to the model, and repeats within the list
+# are analyzed once. The rest are sorted by length before batching so each padded
+# batch holds texts of similar length and little compute is spent on padding tokens.
+def analyze_sentiments(sentiment_analyzer, comments, batch_size=SENTIMENT_BATCH_SIZE, memo=None):
+    scores = [None] * len(comments)
+    pending = {}
+    for i, comment in enumerate(comments):
+        result = memo.get(comment) if memo else None
+        if result is None:
+            pending.setdefault(normalize_comment(comment), []).append(i)
+        else:
+            scores[i] = sentiment_to_score(result)
+
+    order = sorted(pending, key=len)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        texts = [comments[pending[key][0]] for key in bucket]
+        try:
+            results = sentiment_analyzer(texts, batch_size=len(texts), truncation=True)
+        except Exception as e:
+            # Leave the bucket unscored so its items fall back to the rating-only score
+            logger.error(f"Error in batched sentiment analysis: {e}")
+            continue
+        for key, text, result in zip(bucket, texts, results):
+            for i in pending[key]:
+                scores[i] = sentiment_to_score(result)
+            if memo:
+                memo.put(text, result)
+    return scores
+
+
+# Score a list of {rating, comment} items; invalid items get an error entry instead of a score
+def compute_satisfaction_scores(sentiment_analyzer, items, memo=None):
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        error = validate_item(item)
+        if error:
+            results[index] = {'index': index, 'error': error}
+        else:
+            valid.append(index)
+
+    if sentiment_analyzer:
+        sentiment_scores = analyze_sentiments(sentiment_analyzer, [items[i]['comment'] for i in valid], memo=memo)
+    else:
+        # Neutral sentiment, as for single comments when the analyzer is unavailable
+        sentiment_scores = [50] * len(valid)
+
+    for index, sentiment_score in zip(valid, sentiment_scores):
+        rating = items[index]['rating']
+        if sentiment_score is None:
+            score = rating_only_score(rating)
+        else:
+            score = combine_scores(rating, sentiment_score)
+        results[index] = {'index': index, 'satisfactionScore': score}
+    return results
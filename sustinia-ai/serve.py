@@ -0,0 +1,139 @@
+import os
+import gc
+import sys
+import atexit
+import argparse
+import importlib
+import logging
+import tempfile
+
+logger = logging.getLogger('serve')
+
+# Default port for each service; the backend reaches app on 5000 and the dashboards ml on 5001
+DEFAULT_PORTS = {'app': 5000, 'ml': 5001}
+
+
+# Cap the thread pools of every numeric library a worker may use. Environment variables
+# must be set before TensorFlow, PyTorch or BLAS are imported to take effect.
+def limit_threads(intra_op, inter_op):
+    for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS',
+                     'TFLITE_NUM_THREADS', 'ONNX_NUM_THREADS']:
+        os.environ[variable] = str(intra_op)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op)
+
+
+def limit_torch_threads(intra_op, inter_op):
+    if 'torch' not in sys.modules:
+        return
+    import torch
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        # Already fixed once parallel work has run in this process
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a sustinia-ai service with preloaded models and forked workers')
+    parser.add_argument('service', choices=sorted(DEFAULT_PORTS), help='app (port 5000) or ml (port 5001)')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ['PORT']) if os.environ.get('PORT') else None)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS', 2)))
+    # Admission control bounds how many requests run models at once; the threads only need to
+    # cover those plus the admission queues, so the heavy routes never hold every thread
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SERVE_THREADS', 24)),
+                        help='request threads per worker')
+    parser.add_argument('--intra-op-threads', type=int, default=int(os.environ.get('MODEL_INTRA_OP_THREADS', 0)),
+                        help='model threads per worker (default: CPU count divided by workers)')
+    parser.add_argument('--inter-op-threads', type=int, default=int(os.environ.get('MODEL_INTER_OP_THREADS', 1)))
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('SERVE_TIMEOUT', 120)))
+    parser.add_argument('--no-preload', action='store_true', default=os.environ.get('SERVE_PRELOAD', '1') == '0',
+                        help='load models in each worker instead of once in the parent')
+    # TensorFlow and PyTorch start thread pools while loading and running the smoke tests,
+    # which do not survive the fork; only enable after checking the workers with the real models
+    parser.add_argument('--preload-all', action='store_true', default=os.environ.get('SERVE_PRELOAD') == 'all',
+                        help='also preload the TensorFlow / PyTorch models in the parent')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    port = args.port or DEFAULT_PORTS[args.service]
+    intra_op = args.intra_op_threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    limit_threads(intra_op, args.inter_op_threads)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('serve.py needs gunicorn: pip install gunicorn')
+
+    # Importing the service must not start its warm-up or watcher threads: fork-safe models
+    # are loaded here in the parent, the others (or all, with --no-preload) in each worker,
+    # and every worker watches the model files itself, since threads do not survive the fork
+    from model_registry import watch_interval
+    interval = watch_interval()
+    os.environ['WARMUP_MODELS'] = 'none'
+    os.environ['MODEL_WATCH_INTERVAL'] = '0'
+    # Workers write their metrics to files in this directory so /metrics can merge
+    # them; it has to be set before prometheus_client is imported
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='sustainafood-metrics-')
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    service = importlib.import_module(args.service)
+    # Workers save the service's state (sentiment memo, photo index) when they exit; the
+    # parent's copy never changes and must not be saved over theirs
+    atexit.unregister(service.save_state)
+
+    if not args.no_preload:
+        # The pickled models (forecasts, encoders, NumPy heads) are loaded once and shared
+        # with the workers; fork-unsafe ones are loaded by each worker after the fork
+        service.registry.load_all([name for name, model in service.registry.models.items()
+                                   if model.fork_safe or args.preload_all])
+        limit_torch_threads(intra_op, args.inter_op_threads)
+        # Keep the loaded objects out of future collections so the garbage collector
+        # does not touch (and copy) their pages in the forked workers
+        gc.freeze()
+        logger.info(f"Preloaded models: {service.registry.status()}")
+
+    def post_fork(server, worker):
+        limit_torch_threads(intra_op, args.inter_op_threads)
+        # The parent's warm-up covered only the preloaded models; /health/ready reports
+        # this worker as not ready until it has loaded the rest
+        service.registry.warmup_done.clear()
+        atexit.register(service.save_state)
+
+    def post_worker_init(worker):
+        # Load whatever the parent did not in the background: loading here in the worker's
+        # thread would hold off its first heartbeat and get it killed after --timeout
+        service.registry.warm_up(list(service.registry.models))
+        service.registry.watch(interval)
+
+    def child_exit(server, worker):
+        # Drop the live gauges of a worker that exited
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{args.host}:{port}')
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', args.timeout)
+            self.cfg.set('preload_app', not args.no_preload)
+            self.cfg.set('post_fork', post_fork)
+            self.cfg.set('post_worker_init', post_worker_init)
+            self.cfg.set('child_exit', child_exit)
+
+        def load(self):
+            return service.app
+
+    logger.info(f"Serving {args.service} on {args.host}:{port} with {args.workers} workers x {args.threads} threads, "
+                f"{intra_op} intra-op / {args.inter_op_threads} inter-op model threads per worker")
+    Server().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import threading
+
+from flask import Flask, jsonify
+
+import admission
+
+
+def limited_app(monkeypatch, queue):
+    monkeypatch.setenv('ADMISSION_IMAGE_CONCURRENCY', '1')
+    monkeypatch.setenv('ADMISSION_IMAGE_QUEUE', str(queue))
+    monkeypatch.setenv('ADMISSION_IMAGE_DEADLINE_MS', '10000')
+    app = Flask(__name__)
+    started = threading.Event()
+    release = threading.Event()
+
+    # Named like the real route so it joins the image group
+    @app.route('/analyze', endpoint='analyze_image')
+    def analyze_image():
+        started.set()
+        release.wait(10)
+        return jsonify({'ok': True})
+
+    admission.init_app(app)
+    return app, started, release
+
+
+def hold_slot(app, started):
+    thread = threading.Thread(target=lambda: app.test_client().get('/analyze'))
+    thread.start()
+    assert started.wait(10)
+    return thread
+
+
+def test_full_queue_returns_429(monkeypatch):
+    app, started, release = limited_app(monkeypatch, queue=0)
+    thread = hold_slot(app, started)
+    try:
+        response = app.test_client().get('/analyze')
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        thread.join()
+    assert app.test_client().get('/analyze').status_code == 200
+
+
+def test_expired_deadline_returns_503(monkeypatch):
+    app, started, release = limited_app(monkeypatch, queue=1)
+    thread = hold_slot(app, started)
+    try:
+        response = app.test_client().get('/analyze', headers={admission.DEADLINE_HEADER: '50'})
+        assert response.status_code == 503
+    finally:
+        release.set()
+        thread.join()
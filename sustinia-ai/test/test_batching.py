@@ -0,0 +1,65 @@
+import time
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def submit_all(batcher, items):
+    results = [None] * len(items)
+
+    def call(i):
+        try:
+            results[i] = batcher.submit(items[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_batch_is_flushed_when_full():
+    batches = []
+
+    def predict(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    # The wait is far longer than the test: only a full batch can flush it
+    batcher = MicroBatcher('full', predict, max_batch_size=3, max_wait_ms=60000)
+    start = time.monotonic()
+    assert sorted(submit_all(batcher, [1, 2, 3])) == [2, 4, 6]
+    assert time.monotonic() - start < 10
+    assert [len(batch) for batch in batches] == [3]
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    batches = []
+
+    def predict(items):
+        batches.append(list(items))
+        return items
+
+    batcher = MicroBatcher('wait', predict, max_batch_size=16, max_wait_ms=20)
+    assert batcher.submit('a') == 'a'
+    assert batches == [['a']]
+
+
+def test_bad_item_does_not_fail_the_rest_of_its_batch():
+    def predict(items):
+        if 'bad' in items:
+            raise ValueError('bad input')
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher('mixed', predict, max_batch_size=3, max_wait_ms=60000)
+    results = submit_all(batcher, ['a', 'bad', 'c'])
+    assert sorted(result for result in results if isinstance(result, str)) == ['A', 'C']
+    errors = [result for result in results if isinstance(result, Exception)]
+    assert len(errors) == 1
+    with pytest.raises(ValueError):
+        raise errors[0]
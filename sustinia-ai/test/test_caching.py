@@ -0,0 +1,36 @@
+from caching import SentimentMemo
+
+
+def result(label='POSITIVE', score=0.9):
+    return {'label': label, 'score': score}
+
+
+def test_memo_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / 'memo.json')
+    memo = SentimentMemo(path=path)
+    memo.put('  Great   Food ', result())
+    memo.save()
+    assert SentimentMemo(path=path).get('great food') == result()
+
+
+def test_clear_forgets_saved_results(tmp_path):
+    path = str(tmp_path / 'memo.json')
+    memo = SentimentMemo(path=path)
+    memo.put('great food', result())
+    memo.save()
+
+    # Another worker's memo still holds the result in memory
+    other = SentimentMemo(path=path)
+    memo.clear()
+    assert memo.get('great food') is None
+    assert SentimentMemo(path=path).get('great food') is None
+
+    # Results saved after the clear are merged with it again
+    other.clear()
+    other.put('cold food', result('NEGATIVE', 0.8))
+    other.save()
+    memo.put('great food', result())
+    memo.save()
+    reloaded = SentimentMemo(path=path)
+    assert reloaded.get('cold food') == result('NEGATIVE', 0.8)
+    assert reloaded.get('great food') == result()
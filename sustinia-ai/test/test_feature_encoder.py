@@ -0,0 +1,73 @@
+import os
+import random
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_encoder import CATEGORICAL_COLUMNS, FeatureEncoder
+
+ARTIFACTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def artifacts():
+    feature_columns = joblib.load(os.path.join(ARTIFACTS_DIR, 'feature_columns.pkl'))
+    scaler = joblib.load(os.path.join(ARTIFACTS_DIR, 'scaler.pkl'))
+    return feature_columns, scaler
+
+
+def make_records(feature_columns, count, seed=0):
+    # Every level present in feature_columns, plus one level per column that has no
+    # dummy (the level dropped in training) so the all-zero encoding is covered too
+    levels = {column: ['Baseline'] for column in CATEGORICAL_COLUMNS}
+    for name in feature_columns:
+        for column in CATEGORICAL_COLUMNS:
+            if name.startswith(f'{column}_'):
+                levels[column].append(name[len(column) + 1:])
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        record = {column: rng.choice(values) for column, values in levels.items()}
+        record['Number of Guests'] = rng.randint(10, 500)
+        record['Quantity of Food'] = rng.randint(10, 1000)
+        records.append(record)
+    return records
+
+
+def pandas_reference(records, feature_columns, scaler):
+    frame = pd.DataFrame(records)
+    encoded = pd.get_dummies(frame, columns=CATEGORICAL_COLUMNS)
+    encoded = encoded.reindex(columns=feature_columns, fill_value=0)
+    return scaler.transform(encoded)
+
+
+def test_batch_matches_pandas_path(artifacts):
+    feature_columns, scaler = artifacts
+    records = make_records(feature_columns, 500)
+    encoder = FeatureEncoder(feature_columns, scaler)
+    np.testing.assert_allclose(
+        encoder.transform(records), pandas_reference(records, feature_columns, scaler), rtol=0, atol=1e-12
+    )
+
+
+def test_single_rows_match_batch(artifacts):
+    feature_columns, scaler = artifacts
+    records = make_records(feature_columns, 20, seed=1)
+    encoder = FeatureEncoder(feature_columns, scaler)
+    batch = encoder.transform(records)
+    for row, record in enumerate(records):
+        single = encoder.transform_one(record)
+        assert single.shape == (1, len(feature_columns))
+        np.testing.assert_array_equal(single[0], batch[row])
+
+
+def test_rejects_invalid_numbers(artifacts):
+    feature_columns, scaler = artifacts
+    record = make_records(feature_columns, 1)[0]
+    encoder = FeatureEncoder(feature_columns, scaler)
+    with pytest.raises(ValueError):
+        encoder.transform_one(dict(record, **{'Number of Guests': 'many'}))
+    with pytest.raises(ValueError):
+        encoder.transform_one(dict(record, **{'Quantity of Food': None}))
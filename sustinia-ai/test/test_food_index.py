@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+from food_embeddings import EmbeddingIndex
+
+
+def embeddings(count, dim=1280, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_unchanged_index_is_not_saved(tmp_path):
+    path = str(tmp_path / 'food_index')
+    EmbeddingIndex(path).save()
+    assert not os.path.exists(f'{path}.npy')
+
+
+def test_index_saved_without_rows_accepts_embeddings(tmp_path):
+    path = str(tmp_path / 'food_index')
+    # Written by earlier versions that saved an empty index at exit
+    np.save(f'{path}.npy', np.empty((0, 0), dtype=np.float16))
+    with open(f'{path}.json', 'w') as f:
+        f.write('{"ids": [], "labels": []}')
+    index = EmbeddingIndex(path)
+    assert index.dim is None
+    index.add('a', embeddings(1)[0])
+    assert index.search(embeddings(1)[0], k=1)[0]['id'] == 'a'
+    index.save()
+    assert EmbeddingIndex(path).dim == 1280
+
+
+def test_save_restart_add_round_trip(tmp_path):
+    path = str(tmp_path / 'food_index')
+    vectors = embeddings(3)
+    index = EmbeddingIndex(path)
+    index.add('a', vectors[0], 'apple_pie')
+    index.add('b', vectors[1], 'baklava')
+    index.save()
+
+    restarted = EmbeddingIndex(path)
+    assert len(restarted) == 2 and restarted.dim == 1280
+    restarted.add('c', vectors[2], 'cannoli')
+    restarted.save()
+
+    reloaded = EmbeddingIndex(path)
+    for item_id, vector in zip('abc', vectors):
+        match = reloaded.search(vector, k=1)[0]
+        assert match['id'] == item_id and match['similarity'] > 0.99
+    assert reloaded.search(vectors[0], k=1, exclude='a')[0]['id'] != 'a'
+
+
+def test_workers_saving_to_one_file_keep_each_others_rows(tmp_path):
+    path = str(tmp_path / 'food_index')
+    vectors = embeddings(4)
+    first = EmbeddingIndex(path)
+    second = EmbeddingIndex(path)
+    first.add('a', vectors[0])
+    first.save()
+    second.add('b', vectors[1])
+    second.save()
+    assert 'a' in second and 'b' in second
+
+    first.add('c', vectors[2])
+    first.remove('a')
+    first.save()
+    # An unchanged copy, like the one a master process keeps, writes nothing
+    EmbeddingIndex(path).save()
+
+    reloaded = EmbeddingIndex(path)
+    assert sorted(reloaded.ids) == ['b', 'c']
+    assert reloaded.search(vectors[1], k=1)[0]['id'] == 'b'
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from forecast_cache import ForecastCache
+
+
+class FakeProphet:
+    def __init__(self):
+        self.predictions = 0
+
+    def make_future_dataframe(self, periods, include_history=True):
+        return pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=periods)})
+
+    def predict(self, future):
+        self.predictions += 1
+        forecast = future.copy()
+        forecast['yhat'] = forecast['yhat_lower'] = forecast['yhat_upper'] = float(self.predictions)
+        return forecast
+
+
+def test_shorter_horizons_are_served_from_the_cache():
+    model = FakeProphet()
+    cache = ForecastCache('test', max_days=30)
+    assert len(cache.get(model, 7)) == 7
+    assert len(cache.get(model, 30)) == 30
+    assert model.predictions == 1
+
+
+def test_invalidate_recomputes_the_forecast():
+    model = FakeProphet()
+    cache = ForecastCache('test', max_days=30)
+    cache.get(model, 7)
+    cache.invalidate()
+    assert cache.get(model, 7)['yhat'].iloc[0] == 2.0
+    assert model.predictions == 2
+
+
+def test_reloaded_model_gets_its_own_forecast():
+    old, new = FakeProphet(), FakeProphet()
+    cache = ForecastCache('test', max_days=30)
+    cache.get(old, 7)
+    cache.install(new, cache.prepare(new))
+    assert new.predictions == 1
+    cache.get(new, 7)
+    cache.get(old, 7)
+    assert (old.predictions, new.predictions) == (1, 1)
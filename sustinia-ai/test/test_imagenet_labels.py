@@ -0,0 +1,28 @@
+import json
+
+import numpy as np
+import pytest
+
+from imagenet_labels import load_imagenet_labels, top_classes
+
+
+def write_index(path, count=1000):
+    with open(path, 'w') as f:
+        json.dump({str(i): [f'n{i:08d}', f'class_{i}'] for i in range(count)}, f)
+
+
+def test_top_classes_best_first(tmp_path):
+    path = tmp_path / 'imagenet_class_index.json'
+    write_index(path)
+    labels = load_imagenet_labels(path)
+    scores = np.full(1000, 1e-4, dtype=np.float32)
+    scores[[7, 42, 999]] = [0.2, 0.7, 0.1]
+    assert [label for label, _ in top_classes(scores, labels)] == ['class_42', 'class_7', 'class_999']
+    assert top_classes(scores, labels, k=1)[0][1] == pytest.approx(0.7)
+
+
+def test_incomplete_index_is_rejected(tmp_path):
+    path = tmp_path / 'imagenet_class_index.json'
+    write_index(path, count=999)
+    with pytest.raises(ValueError):
+        load_imagenet_labels(path)
@@ -0,0 +1,33 @@
+from model_registry import ModelRegistry
+
+
+def test_disabled_model_is_never_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setenv('ENABLED_MODELS', 'enabled')
+    path = tmp_path / 'model.pkl'
+    path.write_bytes(b'v1')
+    registry = ModelRegistry()
+    registry.register('enabled', lambda: 'model', paths=[str(path)])
+    registry.register('disabled', lambda: 'model', paths=[str(path)])
+
+    assert registry.get('disabled') is None
+    assert registry.get('enabled') == 'model'
+    assert not registry.models['disabled'].artifacts_changed()
+    assert not registry.models['enabled'].artifacts_changed()
+
+
+def test_not_ready_when_every_enabled_model_failed(monkeypatch):
+    monkeypatch.delenv('ENABLED_MODELS', raising=False)
+    registry = ModelRegistry()
+    registry.register('broken', lambda: 1 / 0)
+    registry.register('also_broken', lambda: 1 / 0)
+    assert not registry.ready()
+
+    registry.load_all(['broken'])
+    # also_broken has not been tried yet
+    assert registry.ready()
+
+    registry.load_all()
+    assert not registry.ready()
+
+    registry.register('working', lambda: 'model')
+    assert registry.ready()